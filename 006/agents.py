@@ -1,13 +1,14 @@
 # agents.py
 
+import os
+import re
+import json
+import hashlib
 from autogen import AssistantAgent
 
-# You might want to import these or define them in this file:
-# SYSTEM_PROMPT = ...
-# CODE_AGENT_PROMPT = ...
+GREETING_CACHE_PATH = os.getenv("GREETING_CACHE", "greeting_cache.json")
 
-def get_agents(config_list):
-    SYSTEM_PROMPT = """
+SYSTEM_PROMPT = """
 You are an expert assistant for generating Dynamics 365 plug-ins.
 
 1. Start by asking: "What is the business logic you want to implement in Dynamics 365?" Let the user describe what they need in their own words.
@@ -25,11 +26,12 @@ You are an expert assistant for generating Dynamics 365 plug-ins.
 Always extract as much as possible from what the user has already provided before asking for more.
 """
 
-    CODE_AGENT_PROMPT = """
+CODE_AGENT_PROMPT = """
 You are an expert Dynamics 365 plug-in code generator.
 The user will provide all required details. Output ONLY the C# plug-in code (no explanations) following best practices and .NET 6+ 'v2' SDK conventions.
 """
 
+def get_agents(config_list):
     requirements_agent = AssistantAgent(
         name="RequirementsAgent",
         system_message=SYSTEM_PROMPT,
@@ -38,6 +40,29 @@ The user will provide all required details. Output ONLY the C# plug-in code (no
     code_agent = AssistantAgent(
         name="CodeAgent",
         system_message=CODE_AGENT_PROMPT,
-        llm_config={"config_list": config_list},
+        # streamed so app.py can forward tokens to the page (llm_stream.py)
+        llm_config={"config_list": config_list, "stream": True},
     )
     return requirements_agent, code_agent
+
+def get_greeting(requirements_agent, system_prompt=SYSTEM_PROMPT, cache_path=GREETING_CACHE_PATH):
+    """
+    Opening turn of a new chat without an LLM round trip: the question the
+    prompt says to start with ('Start by asking: "..."'). A prompt without one
+    gets a single reply from requirements_agent, cached in cache_path under the
+    prompt's hash, so it is asked again only when the prompt changes.
+    """
+    found = re.search(r'start by asking:?\s*"([^"]+)"', system_prompt, re.IGNORECASE)
+    if found:
+        return found.group(1)
+
+    key = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    if key not in cached:
+        cached = {key: requirements_agent.generate_reply([{"content": "", "role": "user"}])}
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cached, f, indent=2)
+    return cached[key]
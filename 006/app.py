@@ -1,14 +1,20 @@
 import os
+import copy
+import json
 from dotenv import load_dotenv
 import autogen
 import markdown
-from flask import Flask, render_template, request, session, jsonify
+from flask import Flask, Response, render_template, request, session, jsonify, url_for
 from datetime import datetime
-from collections import defaultdict
 
-from agents import get_agents
+from agents import get_agents, get_greeting
 from tools import plugin_image_guideline, plugin_image_suggestion
-from utils import extract_requirements
+from utils import update_requirements, FETCHING_METADATA, metadata_cache
+from metadata_catalog import MetadataCatalog
+from llm_jobs import JobQueue, QueueFull
+from llm_stream import TokenStream, capture
+from code_cache import CodeCache, spec_key
+from history_store import get_history_store
 
 load_dotenv()
 app = Flask(__name__)
@@ -18,16 +24,28 @@ app.secret_key = os.getenv("FLASK_SECRET", "any-random-secret")
 config_list = autogen.config_list_from_json("OAI_CONFIG_LIST.json")
 requirements_agent, code_agent = get_agents(config_list)
 
+# Opening question of every new chat, derived from the requirements prompt once
+GREETING = get_greeting(requirements_agent)
+
+# Entity/field metadata held in memory, refreshed in the background
+metadata_catalog = MetadataCatalog().start()
+
+# LLM turns run on a bounded pool so Flask workers stay free; see llm_jobs.py
+llm_jobs = JobQueue()
+
+# Generated code by canonical spec, shared by sessions and workers; see code_cache.py
+code_cache = CodeCache()
+
 requirements = ["entity", "trigger", "fields", "logic"]
 CONFIRM_KEYWORDS = {"yes", "y", "confirm", "ok", "correct", "proceed", "go ahead", "generate", "continue"}
 
-# Store per-session code generation history
-code_history_store = defaultdict(list)
+# Per-session code generation history, durable and shared by workers; see history_store.py
+code_history = get_history_store()
 
 def is_ready(reqs, confirmed):
     for r in requirements:
         value = reqs.get(r, "")
-        if not value or "*pending*" in value.lower():
+        if not value or "*pending*" in value.lower() or value == FETCHING_METADATA:
             return False
     return not confirmed
 
@@ -48,52 +66,153 @@ def chat():
     session_id = session["session_id"]
 
     reply = ""
-    user_input = ""
 
     if request.method == "GET":
         if not conversation:
-            agent_reply = requirements_agent.generate_reply([{"content": "", "role": "user"}])
-            conversation.append({"content": agent_reply, "role": "assistant"})
+            conversation.append({"content": GREETING, "role": "assistant"})
             session["conversation"] = conversation
-            reply = agent_reply
+            reply = GREETING
         else:
             reply = conversation[-1]["content"] if conversation else ""
-        return _render(reply, reqs, confirmed)
+        pending_job = None
+        if session.get("job"):
+            job = llm_jobs.get(session["job"], session_id)
+            if job is None:
+                session.pop("job")      # expired or already claimed: nothing to resume
+            else:
+                pending_job = _job_urls(job.id, job.stream is not None)
+        return _render(reply, reqs, confirmed, pending_job=pending_job)
+
+    # The turn runs on llm_jobs against a copy of the session; the page polls
+    # /jobs/<id>, which stores the new session state and returns the page.
+    job = llm_jobs.get(session["job"], session_id) if session.get("job") else None
+    if job is not None and job.status() in ("queued", "running"):
+        return jsonify({"error": "Still working on your previous message.",
+                        **_job_urls(job.id, job.stream is not None)}), 409
+    if job is not None:
+        # finished but never collected (e.g. the page went away): the new message replaces it
+        llm_jobs.pop(job.id, session_id)
+    snapshot = copy.deepcopy(dict(session))
+    snapshot.pop("job", None)
+    form = request.form.to_dict()
+    # an open stream holds a Flask thread, so only turns that generate code get one
+    stream = TokenStream() if _generates_code(snapshot, form) else None
+    try:
+        job_id = llm_jobs.submit(session_id, _chat_turn, snapshot, form, stream, stream=stream)
+    except QueueFull:
+        return jsonify({"error": "The assistant is busy, please try again in a moment."}), 503
+    session["job"] = job_id
+    return jsonify(_job_urls(job_id, stream is not None)), 202
+
+def _job_urls(job_id: str, streamed: bool = False) -> dict:
+    urls = {"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}
+    if streamed:
+        urls["stream_url"] = url_for("job_stream", job_id=job_id)
+    return urls
+
+def _generates_code(state: dict, form: dict) -> bool:
+    """Whether _chat_turn may call code_agent for this POST (a confirm, or a change request after one)."""
+    if "restart" in form:
+        return False
+    user_input = form.get("user_input", "").strip()
+    if state.get("confirmed"):
+        return bool(user_input)
+    return "confirm" in form or user_input.lower() in CONFIRM_KEYWORDS
 
-    user_input = request.form.get("user_input", "").strip()
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    owner = session.get("session_id", "")
+    job = llm_jobs.get(job_id, owner)
+    if job is not None and job.status() in ("queued", "running"):
+        return jsonify({"job_id": job_id, "status": job.status()})
 
-    if "restart" in request.form:
+    # finished, lost or unknown: the session no longer waits for it
+    if session.get("job") == job_id:
+        session.pop("job")
+    job = llm_jobs.pop(job_id, owner) if job is not None else None
+    if job is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    status = job.status()
+    if status == "error":
+        return jsonify({"job_id": job_id, "status": status, "error": job.error()}), 500
+    result = job.result()
+    if "session" in result:
+        # chat turn: its state replaces the session, the page is re-rendered from it
         session.clear()
-        session["conversation"] = []
-        session["reqs"] = {r: "" for r in requirements}
-        session["confirmed"] = False
-        agent_reply = requirements_agent.generate_reply([{"content": "", "role": "user"}])
-        session["conversation"] = [{"content": agent_reply, "role": "assistant"}]
-        return _render(agent_reply, session["reqs"], False)
+        session.update(result["session"])
+        result = {"html": _render(result["reply"], session["reqs"], session["confirmed"])}
+    return jsonify({"job_id": job_id, "status": status, **result})
+
+@app.route("/jobs/<job_id>/stream")
+def job_stream(job_id):
+    """Server-sent events: "token" per chunk of generated code as it arrives, "done" when the job ends."""
+    job = llm_jobs.get(job_id, session.get("session_id", ""))
+    if job is None or job.stream is None:
+        return jsonify({"error": "Unknown or expired job."}), 404
+    # EventSource reconnects with the id of the last event it received
+    try:
+        start = max(int(request.headers.get("Last-Event-ID", -1)) + 1, 0)
+    except ValueError:
+        start = 0
+
+    def events():
+        for index, chunk in job.stream.read(start):
+            if chunk is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {index}\nevent: token\ndata: {json.dumps(chunk)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _chat_turn(state: dict, form: dict, stream: TokenStream | None = None) -> dict:
+    """One POST to / on a copy of the session: {"session": new state, "reply": html}."""
+    conversation = state["conversation"]
+    reqs = state["reqs"]
+    confirmed = state["confirmed"]
+    session_id = state["session_id"]
+
+    reply = ""
+    user_input = form.get("user_input", "").strip()
+
+    if "restart" in form:
+        state = {"conversation": [{"content": GREETING, "role": "assistant"}],
+                 "reqs": {r: "" for r in requirements}, "confirmed": False}
+        return {"session": state, "reply": GREETING}
 
     if confirmed:
         if user_input:
             reqs["logic"] += "\n" + user_input
-            code_block = _generate_code(reqs)
+            code_block = _generate_code(reqs, stream=stream, use_cache="no_cache" not in form)
             reply = markdown.markdown(code_block, extensions=["fenced_code"])
             _save_code_history(session_id, reqs, code_block)
-            return _render(reply, reqs, confirmed)
+            return {"session": state, "reply": reply}
         else:
             reply = "Please type a change request or restart."
-            return _render(reply, reqs, confirmed)
+            return {"session": state, "reply": reply}
 
     if user_input:
         conversation.append({"content": user_input, "role": "user"})
-        session["conversation"] = conversation
 
-    reqs = extract_requirements(conversation, requirements_agent=requirements_agent)
-    session["reqs"] = reqs
+    # only the newly appended message is scanned; see utils.update_requirements
+    extraction = state.setdefault("extraction", {})
+    reqs = update_requirements(conversation, extraction, requirements_agent=requirements_agent,
+                               catalog=metadata_catalog)
+    state["reqs"] = reqs
+
+    if reqs["fields"] == FETCHING_METADATA:
+        reply = (
+            f"Fetching column metadata for <b>{reqs['entity']}</b> in the background. "
+            "Send your next message in a few seconds and I'll match the fields."
+        )
+        return {"session": state, "reply": reply}
 
     missing = [r for r in requirements if not reqs.get(r)]
     all_ready = is_ready(reqs, confirmed)
 
-    if (not missing) and (("confirm" in request.form) or (user_input.lower() in CONFIRM_KEYWORDS)):
-        session["confirmed"] = True
+    if (not missing) and (("confirm" in form) or (user_input.lower() in CONFIRM_KEYWORDS)):
+        state["confirmed"] = True
 
         trigger = reqs["trigger"].lower()
         stage = "PostOperation"
@@ -101,10 +220,10 @@ def chat():
         suggestion = plugin_image_suggestion(trigger, stage)
         advice_message = f"\n\n---\n{guideline}\n\nImage Suggestion: {suggestion['Recommended']}\n"
 
-        code_block = _generate_code(reqs, advice_message)
+        code_block = _generate_code(reqs, advice_message, stream, use_cache="no_cache" not in form)
         reply = markdown.markdown(code_block, extensions=["fenced_code"])
         _save_code_history(session_id, reqs, code_block)
-        return _render(reply, reqs, True)
+        return {"session": state, "reply": reply}
 
     if all_ready:
         summary = (
@@ -115,55 +234,105 @@ def chat():
             f"- <b>Business Logic</b>: {reqs['logic']}<br>"
             f"Please click <b>Confirm</b> in the UI to proceed with generating the code."
         )
-        return _render(summary, reqs, False)
+        return {"session": state, "reply": summary}
 
     if missing:
         agent_reply = requirements_agent.generate_reply(conversation)
         conversation.append({"content": agent_reply, "role": "assistant"})
-        session["conversation"] = conversation
         reply = agent_reply
-        return _render(reply, reqs, False)
+        return {"session": state, "reply": reply}
 
     reply = "All requirements collected. Please review below and click **Confirm & Generate Code** when ready.<br>Or type 'confirm' to generate code."
-    return _render(reply, reqs, False)
+    return {"session": state, "reply": reply}
 
-def _generate_code(reqs: dict, advice_message: str = "") -> str:
+def _generate_code(reqs: dict, advice_message: str = "", stream: TokenStream | None = None,
+                   use_cache: bool = True) -> str:
     prompt = (
         "Generate a Dynamics 365 plug-in in C# with the following specs:\n"
         f"Entity: {reqs['entity']}\n"
         f"Trigger: {reqs['trigger']}\n"
         f"Fields: {reqs['fields']}\n"
         f"Logic: {reqs['logic']}\n"
+        f"{_related_line(reqs)}"
         f"{advice_message}"
     )
-    return code_agent.generate_reply([{"content": prompt, "role": "user"}])
+    spec = {r: reqs.get(r) for r in requirements + ["related"]}
+    return _code_reply(prompt, spec_key(spec, advice_message, code_agent.system_message), stream, use_cache)
+
+def _code_reply(prompt: str, key: str, stream: TokenStream | None, use_cache: bool) -> str:
+    """code_agent's reply to `prompt`, from code_cache unless use_cache is False."""
+    code = code_cache.get(key) if use_cache else None
+    if code is not None:
+        if stream is not None:
+            stream.write(code)
+        return code
+    # tokens go to `stream` as they arrive; the full reply is still returned at the end
+    with capture(stream):
+        code = code_agent.generate_reply([{"content": prompt, "role": "user"}])
+    if isinstance(code, str):
+        code_cache.put(key, code)
+    return code
+
+def _related_line(reqs: dict) -> str:
+    # fields on other tables, with the lookups to follow to reach them
+    related = reqs.get("related") or []
+    return f"Related fields (lookup path): {'; '.join(related)}\n" if related else ""
 
 def _save_code_history(session_id, reqs, code):
-    code_history_store[session_id].append({
+    code_history.append(session_id, {
         "timestamp": datetime.utcnow().isoformat(),
         "plugin_name": reqs.get("plugin_name", "UnknownPlugin"),
         "entity": reqs.get("entity"),
         "trigger": reqs.get("trigger"),
         "fields": reqs.get("fields"),
         "logic": reqs.get("logic"),
+        "related": reqs.get("related", []),
         "code": code
     })
 
 @app.route("/regenerate", methods=["POST"])
 def regenerate():
     new_logic = request.json.get("new_logic")
+    use_cache = not request.json.get("no_cache")
     session_id = session.get("session_id")
-    if not code_history_store[session_id]:
+    last = code_history.latest(session_id) if session_id else None
+    if last is None:
         return jsonify({"error": "No previous plugin to regenerate."}), 400
 
-    last = code_history_store[session_id][-1]
     prompt = f"""Regenerate this plugin with new logic:\n
-Entity: {last['entity']}\nEvent: {last['trigger']}\nFields: {last['fields']}\nOld Logic: {last['logic']}\nNew Logic: {new_logic}"""
+Entity: {last['entity']}\nEvent: {last['trigger']}\nFields: {last['fields']}\n{_related_line(last)}Old Logic: {last['logic']}\nNew Logic: {new_logic}"""
+
+    spec = {k: last.get(k) for k in ("entity", "trigger", "fields", "related", "logic")}
+    key = spec_key({**spec, "new_logic": new_logic}, generator=code_agent.system_message)
+    stream = TokenStream()
+
+    def regenerate_code():
+        return {"code": _code_reply(prompt, key, stream, use_cache)}
+
+    try:
+        job_id = llm_jobs.submit(session_id, regenerate_code, stream=stream)
+    except QueueFull:
+        return jsonify({"error": "The assistant is busy, please try again in a moment."}), 503
+    return jsonify(_job_urls(job_id, streamed=True)), 202
+
+@app.route("/history")
+def history():
+    """This session's generated plugins, newest first: ?limit=N&before=<next from the previous page>."""
+    session_id = session.get("session_id")
+    if not session_id:
+        return jsonify({"items": [], "next": None, "total": 0})
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    page = code_history.page(session_id, limit, request.args.get("before", type=int))
+    return jsonify({**page, "total": code_history.count(session_id)})
 
-    modified_code = code_agent.generate_reply([{"content": prompt, "role": "user"}])
-    return jsonify({"code": modified_code})
+@app.route("/metadata/status")
+def metadata_status():
+    entity = request.args.get("entity", "")
+    return jsonify({"entity": entity, "status": metadata_catalog.status(entity),
+                    "cache": metadata_cache.stats(), "llm_jobs": llm_jobs.stats(),
+                    "code_cache": code_cache.stats()})
 
-def _render(reply: str, reqs: dict, confirmed: bool):
+def _render(reply: str, reqs: dict, confirmed: bool, pending_job: dict | None = None):
     progress_lines = [f"**{r.capitalize()}**: {reqs.get(r, '*pending*') or '*pending*'}" for r in requirements]
     progress_md = "<br>".join(progress_lines)
     all_ready = is_ready(reqs, confirmed)
@@ -174,6 +343,7 @@ def _render(reply: str, reqs: dict, confirmed: bool):
         progress_md=progress_md,
         all_ready=all_ready,
         confirmed=confirmed,
+        pending_job=pending_job,
     )
 
 if __name__ == "__main__":
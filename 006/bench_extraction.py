@@ -0,0 +1,250 @@
+"""
+bench_extraction.py  –  Latency / allocation / accuracy benchmark for extraction
+-------------------------------------------------------------------------------
+
+Runs a labelled utterance corpus through
+
+    fields        utils.extract_fields_from_text   (inclusive candidate list)
+    requirements  utils.extract_requirements       (entity, trigger, picked field)
+
+over every harvested table in fields/ plus synthetic wide tables, and
+reports per table group:
+
+    p50 / p99 latency, peak allocation per call (tracemalloc),
+    precision / recall of fields, entity / trigger accuracy, LLM calls
+
+extraction_corpus.json holds the hand-labelled utterances for the real
+tables; wide tables get generated ones. The LLM is replaced by an offline
+agent that picks the first candidate it is offered, so "llm_calls" counts the
+round trips the real app would make. Timings are warm (metadata caches
+loaded), which is what the chat app sees after startup.
+
+Run:
+    python bench_extraction.py
+    python bench_extraction.py --wide 1000 5000 10000 --repeat 20
+    python bench_extraction.py --save-baseline extraction_baseline.json
+    python bench_extraction.py --baseline extraction_baseline.json --check
+"""
+
+import os, re, json, glob, time, random, shutil, argparse, tempfile, tracemalloc
+
+WORDS = ["billing", "shipping", "customer", "region", "priority", "renewal", "contract",
+         "invoice", "discount", "territory", "channel", "warranty", "service", "partner",
+         "budget", "forecast", "approval", "compliance", "delivery", "supplier", "inventory", "quota",
+         "campaign", "loyalty", "tier", "risk", "score", "portal", "language", "currency"]
+TEMPLATES = ["When a {table} record is updated, validate the {field}",
+             "On create of {table}, default the {field} to zero",
+             "Before a {table} is deleted check the {field}",
+             "When the {field} on a {table} is updated notify the owner"]
+TRIGGER_OF = {0: "update", 1: "create", 2: "delete", 3: "update"}
+
+
+class OfflineAgent:
+    """Stands in for requirements_agent: answers a clarification with the first candidate."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def generate_reply(self, messages):
+        self.calls += 1
+        found = re.search(r"matches \(by logical name\) are: (.*?)\.\n", messages[-1]["content"])
+        return found.group(1).split(", ")[0] if found else ""
+
+
+# ----------------------------------------------------------------- fixtures
+def wide_table(columns: int, seed: int = 0) -> tuple[str, str, dict]:
+    """(logical, display, fields_dict) of a synthetic table with `columns` columns."""
+    rnd = random.Random(seed + columns)
+    logical, display = f"bench_wide{columns}", f"wide table {columns}"
+    fields, seen = {}, set()
+    while len(fields) < columns:
+        words = rnd.sample(WORDS, rnd.randint(2, 3))
+        name = " ".join(words).title() + f" {rnd.randint(1, 99)}"
+        if name in seen:
+            continue
+        seen.add(name)
+        col = "bench_" + "".join(words) + name.rsplit(" ", 1)[1]
+        fields[col] = {"logicalName": col, "displayName": name, "type": "String",
+                       "targets": [], "optionset": []}
+    return logical, display, fields
+
+
+def wide_corpus(logical: str, display: str, fields: dict, count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for col in rnd.sample(sorted(fields), min(count, len(fields))):
+        i = rnd.randrange(len(TEMPLATES))
+        out.append({"text": TEMPLATES[i].format(table=display, field=fields[col]["displayName"]),
+                    "entity": logical, "trigger": TRIGGER_OF[i], "fields": [col]})
+    return out
+
+
+def prepare_workdir(fields_folder: str, entity_map_path: str, wide: list, per_table: int) -> dict:
+    """Scratch folder with fields/ + entity_map.json; returns {group: corpus}."""
+    workdir = tempfile.mkdtemp(prefix="bench_extraction_")
+    os.makedirs(os.path.join(workdir, "fields"))
+    for path in glob.glob(os.path.join(fields_folder, "*.json")):
+        shutil.copy(path, os.path.join(workdir, "fields"))
+    entity_map = {}
+    if os.path.isfile(entity_map_path):
+        with open(entity_map_path, "r", encoding="utf-8") as f:
+            entity_map = json.load(f)
+
+    groups = {}
+    for columns in wide:
+        logical, display, fields = wide_table(columns)
+        with open(os.path.join(workdir, "fields", f"{logical}_fields.json"), "w", encoding="utf-8") as f:
+            json.dump(fields, f)
+        entity_map[display] = logical
+        groups[f"wide{columns}"] = wide_corpus(logical, display, fields, per_table)
+    with open(os.path.join(workdir, "entity_map.json"), "w", encoding="utf-8") as f:
+        json.dump(entity_map, f, indent=2)
+    os.chdir(workdir)
+    return groups
+
+
+# ----------------------------------------------------------------- measuring
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _measure(call, repeat: int):
+    """(result, seconds per call, peak KiB of one call)."""
+    call()                                  # warm caches
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = call()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, times, peak / 1024
+
+
+def _accuracy(pairs: list) -> dict:
+    tp = sum(len(pred & exp) for pred, exp in pairs)
+    fp = sum(len(pred - exp) for pred, exp in pairs)
+    fn = sum(len(exp - pred) for pred, exp in pairs)
+    return {"precision": round(tp / (tp + fp), 3) if tp + fp else 1.0,
+            "recall": round(tp / (tp + fn), 3) if tp + fn else 1.0}
+
+
+def _summary(times: list, peaks: list) -> dict:
+    return {"p50_ms": round(_percentile(times, 50) * 1e3, 3),
+            "p99_ms": round(_percentile(times, 99) * 1e3, 3),
+            "peak_kib_p50": round(_percentile(peaks, 50), 1),
+            "peak_kib_max": round(max(peaks, default=0.0), 1)}
+
+
+def bench_group(corpus: list, repeat: int) -> dict:
+    from utils import extract_fields_from_text, extract_requirements, load_field_map
+
+    field_times, field_peaks, field_pairs = [], [], []
+    req_times, req_peaks, req_pairs = [], [], []
+    entity_hits = trigger_hits = llm_calls = 0
+    for case in corpus:
+        expected = set(case["fields"])
+        if case["entity"]:
+            field_map, _ = load_field_map(case["entity"])
+            found, times, peak = _measure(lambda: extract_fields_from_text(field_map, case["text"]), repeat)
+            field_times += times
+            field_peaks.append(peak)
+            field_pairs.append((set(found), expected))
+
+        agent = OfflineAgent()
+        conversation = [{"role": "user", "content": case["text"]}]
+        reqs, times, peak = _measure(lambda: extract_requirements(conversation, agent), repeat)
+        llm_calls += agent.calls // (repeat + 2)            # per extraction, not per timing run
+        req_times += times
+        req_peaks.append(peak)
+        picked = set() if "*" in reqs["fields"] else {f for f in reqs["fields"].split(", ") if f}
+        req_pairs.append((picked, expected))
+        entity_hits += reqs["entity"] == case["entity"]
+        trigger_hits += reqs["trigger"] == case["trigger"]
+
+    requirements = {**_summary(req_times, req_peaks), **_accuracy(req_pairs),
+                    "entity_accuracy": round(entity_hits / len(corpus), 3) if corpus else 1.0,
+                    "trigger_accuracy": round(trigger_hits / len(corpus), 3) if corpus else 1.0,
+                    "llm_calls": llm_calls}
+    return {"utterances": len(corpus),
+            "fields": {**_summary(field_times, field_peaks), **_accuracy(field_pairs)},
+            "requirements": requirements}
+
+
+# ----------------------------------------------------------------- baseline
+def _flatten(results: dict) -> dict:
+    return {f"{group}.{mode}.{metric}": value
+            for group, res in results["groups"].items()
+            for mode in ("fields", "requirements")
+            for metric, value in res[mode].items()}
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list:
+    """Print metric diffs; returns the regressions."""
+    old, new = _flatten(baseline), _flatten(results)
+    regressions = []
+    print(f"\n{'metric':<42}{'baseline':>12}{'now':>12}{'change':>10}")
+    for key in sorted(old.keys() | new.keys()):
+        a, b = old.get(key), new.get(key)
+        change = f"{(b - a) / a * 100:+.0f}%" if a and b is not None else ""
+        print(f"{key:<42}{str(a):>12}{str(b):>12}{change:>10}")
+        if a is None or b is None:
+            continue
+        metric = key.rsplit(".", 1)[1]
+        if metric in ("precision", "recall", "entity_accuracy", "trigger_accuracy") and b < a:
+            regressions.append(key)
+        elif metric == "llm_calls" and b > a:
+            regressions.append(key)
+        elif metric == "p50_ms" and a and b > a * (1 + tolerance):
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark requirement/field extraction.")
+    parser.add_argument("--fields", default=os.path.join(here, "fields"), help="harvested field files")
+    parser.add_argument("--entity-map", default=os.path.join(here, "entity_map.json"))
+    parser.add_argument("--corpus", default=os.path.join(here, "extraction_corpus.json"))
+    parser.add_argument("--wide", type=int, nargs="*", default=[1000, 10000],
+                        help="column counts of synthetic wide tables")
+    parser.add_argument("--per-table", type=int, default=20, help="generated utterances per wide table")
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per utterance")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed p50 slowdown (0.5 = +50%%)")
+    parser.add_argument("--check", action="store_true", help="exit 1 on regressions vs --baseline")
+    args = parser.parse_args()
+    # prepare_workdir chdirs into a scratch folder
+    for name in ("save_baseline", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    groups = {"real": corpus, **prepare_workdir(args.fields, args.entity_map, args.wide, args.per_table)}
+
+    results = {"config": {"wide": args.wide, "per_table": args.per_table, "repeat": args.repeat},
+               "groups": {name: bench_group(cases, args.repeat) for name, cases in groups.items()}}
+
+    cols = ["utterances", "p50_ms", "p99_ms", "peak_kib_p50", "precision", "recall"]
+    print(f"{'group':<12}{'mode':<14}" + "".join(f"{c:>14}" for c in cols) + f"{'entity':>8}{'llm':>6}")
+    for name, res in results["groups"].items():
+        for mode in ("fields", "requirements"):
+            row = {"utterances": res["utterances"], **res[mode]}
+            extra = (f"{row['entity_accuracy']:>8}{row['llm_calls']:>6}" if mode == "requirements" else "")
+            print(f"{name:<12}{mode:<14}" + "".join(f"{str(row[c]):>14}" for c in cols) + extra)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        if regressions:
+            print("\nRegressions: " + ", ".join(regressions))
+            if args.check:
+                raise SystemExit(1)
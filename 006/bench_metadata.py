@@ -0,0 +1,128 @@
+"""
+bench_metadata.py  –  Request-count / wall-time / memory benchmark
+-----------------------------------------------------------------
+
+Runs the real metadata pipeline (fetch_entities → fetch_fields.harvest)
+against fake_dataverse.py and reports, per harvest mode:
+
+    requests per table, total requests, 429s, wall time, peak memory
+
+The stand-in runs in a child process so its allocations are not counted.
+
+Run:
+    python bench_metadata.py --tables 50 --columns 300
+    python bench_metadata.py --tables 20 --columns 400 --latency-ms 30 --throttle-rate 0.02
+    python bench_metadata.py --from-fields fields --mode both
+"""
+
+import os, io, json, time, argparse, tempfile, contextlib, tracemalloc
+import multiprocessing as mp
+import requests
+
+import token_broker
+import fake_dataverse
+from crm_metadata_client import CrmMetadataClient
+from fetch_entities import fetch_entities_for_solutions
+from fetch_fields import harvest
+from metadata_store import MetadataStore
+
+
+def _run_server(args, port_queue):
+    fixture = (fake_dataverse.fixture_from_fields(args.from_fields) if args.from_fields
+               else fake_dataverse.synthetic_fixture(args.tables, args.columns))
+    srv = fake_dataverse.StandInServer(("127.0.0.1", 0), fixture, latency_ms=args.latency_ms,
+                                       throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    port_queue.put((srv.server_address[1], list(fixture["solutions"])[0]))
+    srv.serve_forever()
+
+
+def _stats(url: str) -> dict:
+    return requests.get(f"{url}/_stats").json()
+
+
+def bench_mode(url: str, solution: str, bulk: bool, workers: int) -> dict:
+    requests.post(f"{url}/_stats/reset")
+    workdir = tempfile.mkdtemp(prefix="bench_metadata_")
+    os.chdir(workdir)
+    with open("crm_config.json", "w", encoding="utf-8") as f:
+        json.dump({"tenant_id": "bench", "client_id": "bench", "client_secret": "bench",
+                   "resource": url}, f)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        entities = fetch_entities_for_solutions([solution])
+    resolved = time.perf_counter()
+    entity_requests = _stats(url).get("_api_total", 0)
+
+    client = CrmMetadataClient("crm_config.json")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = harvest(client, [lg for lg, _ in entities.values()], workers,
+                         MetadataStore(os.path.join(workdir, "metadata.db")), bulk=bulk)
+    finished = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = _stats(url)
+    tables = len(entities)
+    harvest_requests = stats.get("_api_total", 0) - entity_requests
+    return {
+        "mode": "bulk" if bulk else "per-column",
+        "tables": tables,
+        "columns": sum(result["saved"].values()),
+        "failed": len(result["failed"]),
+        "entity_requests": entity_requests,
+        "harvest_requests": harvest_requests,
+        "requests_per_table": round(harvest_requests / tables, 1) if tables else 0.0,
+        "throttled": stats.get("throttled", 0),
+        "token_requests": stats.get("token", 0),
+        "entity_seconds": round(resolved - started, 3),
+        "harvest_seconds": round(finished - resolved, 3),
+        "peak_mib": round(peak / 2**20, 1),
+        "workdir": workdir,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the metadata pipeline against the stand-in.")
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--columns", type=int, default=300)
+    parser.add_argument("--from-fields", metavar="FOLDER",
+                        help="replay harvested fields/*.json instead of synthetic tables")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", choices=("bulk", "per-column", "both"), default="both")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.0)
+    parser.add_argument("--json", metavar="PATH", help="also write the results here")
+    args = parser.parse_args()
+    # bench_mode chdirs into a scratch folder per run
+    if args.from_fields:
+        args.from_fields = os.path.abspath(args.from_fields)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    port_queue = mp.Queue()
+    server = mp.Process(target=_run_server, args=(args, port_queue), daemon=True)
+    server.start()
+    port, solution = port_queue.get(timeout=60)
+    url = f"http://127.0.0.1:{port}"
+
+    token_broker._broker = token_broker.TokenBroker(
+        background_refresh=False, authority_host=url,
+        app_factory=fake_dataverse.StandInTokenApp)
+
+    modes = {"bulk": [True], "per-column": [False], "both": [True, False]}[args.mode]
+    results = [bench_mode(url, solution, bulk, args.workers) for bulk in modes]
+    server.terminate()
+
+    cols = ["mode", "tables", "columns", "failed", "entity_requests", "harvest_requests",
+            "requests_per_table", "throttled", "entity_seconds", "harvest_seconds", "peak_mib"]
+    widths = [max(len(c), 10) for c in cols]
+    print("  ".join(f"{c:>{w}}" for c, w in zip(cols, widths)))
+    for r in results:
+        print("  ".join(f"{str(r[c]):>{w}}" for c, w in zip(cols, widths)))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
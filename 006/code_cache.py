@@ -0,0 +1,139 @@
+"""
+code_cache.py
+-------------
+
+Persistent, content-addressed cache of generated plug-in code, so an
+identical spec – across sessions, restarts and /regenerate – is answered
+from disk instead of the LLM.
+
+    cache = CodeCache()                                   # code_cache.db (or $CODE_CACHE_DB)
+    key = spec_key(reqs, advice_message, code_agent.system_message)
+    code = cache.get(key)
+    if code is None:
+        code = code_agent.generate_reply(...)
+        cache.put(key, code)
+
+Keys are the SHA-256 of the canonical spec: string values with whitespace
+collapsed, "fields" as a sorted set, lists sorted, dict keys sorted; plus the
+advice text and the generator's system prompt, so a prompt change misses.
+
+Entries are evicted least-recently-used once the stored code exceeds
+CODE_CACHE_MAX_MB (0 disables the cache). One connection per thread; WAL
+mode lets several workers share the file.
+"""
+
+import os, json, time, sqlite3, hashlib, threading
+from typing import Any, Dict
+
+CODE_CACHE_PATH = os.getenv("CODE_CACHE_DB", "code_cache.db")
+CODE_CACHE_MAX_MB = float(os.getenv("CODE_CACHE_MAX_MB", "64"))
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS code (
+    key       TEXT PRIMARY KEY,
+    code      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_code_last_used ON code (last_used);
+"""
+
+
+def _canonical(name: str, value: Any) -> Any:
+    if name == "fields" and isinstance(value, str):
+        return sorted({f.strip() for f in value.split(",") if f.strip()})
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, (list, tuple, set)):
+        return sorted(_canonical("", v) for v in value)
+    return value
+
+
+def spec_key(spec: Dict[str, Any], advice: str = "", generator: str = "") -> str:
+    """Hash of the normalized spec + advice message + generator prompt."""
+    canonical = {k: _canonical(k, v) for k, v in spec.items() if v not in (None, "", [])}
+    payload = json.dumps([canonical, _canonical("", advice), _canonical("", generator)],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CodeCache:
+    def __init__(self, path: str = CODE_CACHE_PATH, max_mb: float = CODE_CACHE_MAX_MB) -> None:
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = self.misses = self.evictions = 0
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if self.enabled:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS code")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(SCHEMA)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # ----- Public API -----
+    def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+        conn = self._conn()
+        row = conn.execute("SELECT code FROM code WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._write_lock, conn:
+            conn.execute("UPDATE code SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, code: str) -> None:
+        size = len(code.encode("utf-8"))
+        if not self.enabled or not code or size > self.max_bytes:
+            return
+        now = time.time()
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO code VALUES (?, ?, ?, ?, ?)",
+                             (key, code, size, now, now))
+                self._evict(conn)
+
+    def clear(self) -> None:
+        if self.enabled:
+            with self._write_lock, self._conn() as conn:
+                conn.execute("DELETE FROM code")
+
+    def stats(self) -> Dict[str, int]:
+        entries = size = 0
+        if self.enabled:
+            entries, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM code").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    # ----- Private helper methods -----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop least recently used entries until the stored code fits max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM code").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM code ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM code WHERE key = ?", evicted)
+        self.evictions += len(evicted)
@@ -6,43 +6,194 @@ Dataverse metadata client to fetch table attributes including:
 - Lookup targets
 - Local and global OptionSet values and labels
 
+By default columns are fetched in bulk: one query for the attribute list,
+one for all lookup targets and one per choice metadata type, instead of
+one request per lookup/choice column.
+
 Uses crm_config.json for configuration.
 """
 
-import json, os, time, requests
+import json, os, threading, time, requests
+from urllib.parse import quote
 from typing import Dict, Any, List
-from msal import ConfidentialClientApplication
+from token_broker import get_token
+
+# Typed-cast attribute collections that carry option sets (bulk mode)
+OPTIONSET_METADATA_TYPES = (
+    "PicklistAttributeMetadata",
+    "MultiSelectPicklistAttributeMetadata",
+    "StateAttributeMetadata",
+    "StatusAttributeMetadata",
+)
+OPTIONSET_EXPAND = "OptionSet($select=Options),GlobalOptionSet($select=Options)"
+# Bulk mode only needs the name of a global choice; its options come from the cache
+BULK_OPTIONSET_EXPAND = "OptionSet($select=Options),GlobalOptionSet($select=Name)"
+
+MAX_THROTTLE_RETRIES = 5
+
+# RetrieveMetadataChanges fault raised when a ClientVersionStamp is too old
+EXPIRED_VERSION_STAMP = "0x80044352"
+
+
+class VersionStampExpired(Exception):
+    pass
+
 
 class CrmMetadataClient:
     def __init__(self, cfg_path: str = "crm_config.json") -> None:
         self.config = self._load_cfg(cfg_path)
         self.token: str | None = None
-        self.token_expiry: float = 0.0
+        self._global_optionsets: Dict[str, List[Dict[str, Any]]] | None = None
+        self._global_lock = threading.Lock()
+
+    def get_attributes(self, table_logical_name: str, bulk: bool = True,
+                       global_refs: bool = False) -> List[Dict[str, Any]]:
+        """
+        Return every column of *table_logical_name* as
+        {logicalName, displayName, type, targets, optionset}.
+
+        bulk=True  → a handful of typed-cast collection queries per table
+        bulk=False → legacy path, one extra GET per lookup/choice column
 
-    def get_attributes(self, table_logical_name: str) -> List[Dict[str, Any]]:
+        In bulk mode global choices come from get_global_optionsets().  With
+        global_refs=True such columns carry "globalOptionSet": <name> and an
+        empty optionset instead of a copy of the options.
+        """
         self._ensure_token()
-        api = self.config["resource"]
-        hdr = {"Authorization": f"Bearer {self.token}", "Accept": "application/json"}
+        if bulk:
+            return self._get_attributes_bulk(table_logical_name, global_refs)
+        return self._get_attributes_per_column(table_logical_name)
+
+    def get_global_optionsets(self) -> Dict[str, List[Dict[str, Any]]]:
+        """{ name: [{value, label}, ...] } for every global choice, loaded once per client."""
+        if self._global_optionsets is None:
+            with self._global_lock:
+                if self._global_optionsets is None:
+                    self._ensure_token()
+                    api = self.config["resource"]
+                    rows = self._get_json(f"{api}/api/data/v9.2/GlobalOptionSetDefinitions")["value"]
+                    # boolean sets have TrueOption/FalseOption instead of Options
+                    self._global_optionsets = {
+                        row["Name"]: self._options({"OptionSet": row})
+                        for row in rows if row.get("Options") is not None
+                    }
+        return self._global_optionsets
+
+    def get_metadata_changes(self, table_logical_names: List[str],
+                             client_version_stamp: str | None = None,
+                             global_refs: bool = False) -> Dict[str, Any]:
+        """
+        RetrieveMetadataChanges for the given tables.
+
+        Without a stamp every column is returned; with one, only tables and
+        columns changed since then plus DeletedMetadata.  Columns are shaped
+        like get_attributes(..., global_refs) returns them.  Returns
+        { "stamp": ServerVersionStamp,
+          "tables": { logical: {"metadataId", "columns": [{..., "metadataId"}]} },
+          "deleted": set of deleted MetadataIds,
+          "optionsets": { name: [{value, label}, ...] } for the global choices
+                        referenced when global_refs is set }.
+        Raises VersionStampExpired when the server no longer knows the stamp.
+        """
+        self._ensure_token()
+        query = {
+            "Criteria": {
+                "FilterOperator": "Or",
+                "Conditions": [
+                    {"PropertyName": "LogicalName", "ConditionOperator": "Equals",
+                     "Value": {"Type": "System.String", "Value": name}}
+                    for name in table_logical_names
+                ],
+            },
+            "Properties": {"AllProperties": False,
+                           "PropertyNames": ["MetadataId", "LogicalName", "Attributes"]},
+            "AttributeQuery": {
+                "Properties": {"AllProperties": False,
+                               "PropertyNames": ["MetadataId", "LogicalName", "DisplayName",
+                                                 "AttributeType", "Targets", "OptionSet"]},
+            },
+        }
+        params = ["Query=@q"]
+        aliases = f"@q={quote(json.dumps(query, separators=(',', ':')))}"
+        if client_version_stamp:
+            params += ["ClientVersionStamp=@s", "DeletedMetadataFilters=@d"]
+            stamp = "'" + client_version_stamp.replace("'", "''") + "'"
+            aliases += (f"&@s={quote(stamp)}"
+                        "&@d=Microsoft.Dynamics.CRM.DeletedMetadataFilters'Default'")
+        url = (f"{self.config['resource']}/api/data/v9.2/"
+               f"RetrieveMetadataChanges({','.join(params)})?{aliases}")
+
+        resp = self._get(url)
+        if resp.status_code >= 400 and EXPIRED_VERSION_STAMP in resp.text:
+            raise VersionStampExpired(resp.text)
+        resp.raise_for_status()
+        data = resp.json()
+
+        tables, optionsets = {}, {}
+        for ent in data.get("EntityMetadata") or []:
+            columns = []
+            for attr in ent.get("Attributes") or []:
+                col = self._column(attr)
+                col["targets"] = attr.get("Targets") or []
+                option_set = attr.get("OptionSet") or {}
+                global_name = option_set.get("Name") if option_set.get("IsGlobal") else None
+                if global_name and global_refs:
+                    optionsets[global_name] = self._options(attr)
+                self._set_options(col, attr, global_name, global_refs)
+                col["metadataId"] = attr.get("MetadataId")
+                columns.append(col)
+            tables[ent["LogicalName"]] = {"metadataId": ent.get("MetadataId"), "columns": columns}
+
+        # DeletedMetadata: {"Keys": [filter, ...], "Values": [[MetadataId, ...], ...]}
+        deleted = set()
+        for ids in (data.get("DeletedMetadata") or {}).get("Values") or []:
+            deleted.update(ids if isinstance(ids, list) else [ids])
 
-        base = f"{api}/api/data/v9.2/EntityDefinitions(LogicalName='{table_logical_name}')"
+        return {"stamp": data.get("ServerVersionStamp"), "tables": tables, "deleted": deleted,
+                "optionsets": optionsets}
+
+    def _get_attributes_bulk(self, table_logical_name: str,
+                             global_refs: bool = False) -> List[Dict[str, Any]]:
+        base = self._entity_url(table_logical_name)
+        attributes = [self._column(attr) for attr in self._get_json(
+            f"{base}/Attributes?$select=LogicalName,DisplayName,AttributeType")["value"]]
+        by_name = {col["logicalName"]: col for col in attributes}
+
+        # One query returns Targets for every Lookup / Customer / Owner column
+        for attr in self._get_json(
+            f"{base}/Attributes/Microsoft.Dynamics.CRM.LookupAttributeMetadata"
+            "?$select=LogicalName,Targets"
+        )["value"]:
+            if attr["LogicalName"] in by_name:
+                by_name[attr["LogicalName"]]["targets"] = attr.get("Targets") or []
+
+        # One query per choice metadata type; local option sets expanded inline,
+        # global ones only by name and resolved from the shared cache
+        for cast in OPTIONSET_METADATA_TYPES:
+            url = (
+                f"{base}/Attributes/Microsoft.Dynamics.CRM.{cast}"
+                f"?$select=LogicalName&$expand={BULK_OPTIONSET_EXPAND}"
+            )
+            for attr in self._get_json(url)["value"]:
+                col = by_name.get(attr["LogicalName"])
+                if col is None:
+                    continue
+                self._set_options(col, attr, (attr.get("GlobalOptionSet") or {}).get("Name"), global_refs)
+
+        return attributes
+
+    def _get_attributes_per_column(self, table_logical_name: str) -> List[Dict[str, Any]]:
+        base = self._entity_url(table_logical_name)
         coll_url = f"{base}/Attributes?$select=LogicalName,DisplayName,AttributeType"
-        resp = requests.get(coll_url, headers=hdr)
+        resp = self._get(coll_url)
         resp.raise_for_status()
 
         attributes = []
 
         for attr in resp.json()["value"]:
-            logical_name = attr["LogicalName"]
-            display_name = ((attr.get("DisplayName") or {}).get("UserLocalizedLabel") or {}).get("Label", logical_name)
-            attr_type = attr.get("AttributeType", "Unknown")
-
-            col = {
-                "logicalName": logical_name,
-                "displayName": display_name,
-                "type": attr_type,
-                "targets": [],
-                "optionset": []
-            }
+            col = self._column(attr)
+            logical_name = col["logicalName"]
+            attr_type = col["type"]
 
             # Fetch Lookup Targets
             if attr_type in ("Lookup", "Customer", "Owner"):
@@ -50,7 +201,7 @@ class CrmMetadataClient:
                     f"{base}/Attributes(LogicalName='{logical_name}')"
                     "/Microsoft.Dynamics.CRM.LookupAttributeMetadata"
                 )
-                lookup_resp = requests.get(lookup_url, headers=hdr)
+                lookup_resp = self._get(lookup_url)
                 if lookup_resp.status_code == 200:
                     col["targets"] = lookup_resp.json().get("Targets", [])
 
@@ -69,24 +220,10 @@ class CrmMetadataClient:
                     f"{base}/Attributes(LogicalName='{logical_name}')/{attr_metadata_type}"
                     "?$expand=OptionSet($select=Options),GlobalOptionSet($select=Options)"
                 )
-                picklist_resp = requests.get(picklist_url, headers=hdr)
+                picklist_resp = self._get(picklist_url)
 
                 if picklist_resp.status_code == 200:
-                    data = picklist_resp.json()
-                    opts = []
-                    if data.get("OptionSet", {}).get("Options"):
-                        opts = data["OptionSet"]["Options"]
-                    elif data.get("GlobalOptionSet", {}).get("Options"):
-                        opts = data["GlobalOptionSet"]["Options"]
-
-                    col["optionset"] = [
-                        {
-                            "value": o["Value"],
-                            "label": o["Label"]["UserLocalizedLabel"]["Label"]
-                            if o["Label"].get("UserLocalizedLabel") else str(o["Value"])
-                        }
-                        for o in opts
-                    ]
+                    col["optionset"] = self._options(picklist_resp.json())
                 else:
                     print(f"Picklist fetch failed [{logical_name}]: {picklist_resp.status_code}: {picklist_resp.text}")
 
@@ -103,20 +240,73 @@ class CrmMetadataClient:
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}", "Accept": "application/json"}
+
+    def _entity_url(self, table_logical_name: str) -> str:
+        api = self.config["resource"]
+        return f"{api}/api/data/v9.2/EntityDefinitions(LogicalName='{table_logical_name}')"
+
+    def _get(self, url: str) -> requests.Response:
+        # Dataverse service protection answers 429 with a Retry-After delay
+        for _ in range(MAX_THROTTLE_RETRIES):
+            resp = requests.get(url, headers=self._headers())
+            if resp.status_code != 429:
+                return resp
+            time.sleep(float(resp.headers.get("Retry-After", 1)))
+        return resp
+
+    def _get_json(self, url: str) -> Dict[str, Any]:
+        resp = self._get(url)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _set_options(self, col: Dict[str, Any], attr: Dict[str, Any],
+                     global_name: str | None, global_refs: bool) -> None:
+        """Fill a choice column: a globalOptionSet reference, or its options inline."""
+        if not global_name:
+            col["optionset"] = self._options(attr)
+        elif global_refs:
+            col["globalOptionSet"] = global_name
+        else:
+            col["optionset"] = self._options(attr) or self.get_global_optionsets().get(global_name, [])
+
+    @staticmethod
+    def _label(label: Dict[str, Any] | None, default: str) -> str:
+        return ((label or {}).get("UserLocalizedLabel") or {}).get("Label", default)
+
+    @classmethod
+    def _column(cls, attr: Dict[str, Any]) -> Dict[str, Any]:
+        logical_name = attr["LogicalName"]
+        return {
+            "logicalName": logical_name,
+            "displayName": cls._label(attr.get("DisplayName"), logical_name),
+            "type": attr.get("AttributeType", "Unknown"),
+            "targets": [],
+            "optionset": []
+        }
+
+    @classmethod
+    def _options(cls, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        opts = []
+        if (data.get("OptionSet") or {}).get("Options"):
+            opts = data["OptionSet"]["Options"]
+        elif (data.get("GlobalOptionSet") or {}).get("Options"):
+            opts = data["GlobalOptionSet"]["Options"]
+        out = []
+        for o in opts:
+            opt = {"value": o["Value"], "label": cls._label(o.get("Label"), str(o["Value"]))}
+            localized = {str(l["LanguageCode"]): l["Label"]
+                         for l in (o.get("Label") or {}).get("LocalizedLabels") or [] if l.get("Label")}
+            if len(localized) > 1:      # only multi-language orgs; keeps field files small
+                opt["localizedLabels"] = localized
+            out.append(opt)
+        return out
+
     def _ensure_token(self) -> None:
-        if self.token and time.time() < self.token_expiry - 60:
-            return
+        # served from the shared broker's memory cache; safe across harvest workers
         cfg = self.config
-        app = ConfidentialClientApplication(
-            client_id=cfg["client_id"],
-            authority=f"https://login.microsoftonline.com/{cfg['tenant_id']}",
-            client_credential=cfg["client_secret"],
-        )
-        t = app.acquire_token_for_client(scopes=[f"{cfg['resource']}/.default"])
-        if "access_token" not in t:
-            raise RuntimeError(f"Token error: {t}")
-        self.token = t["access_token"]
-        self.token_expiry = int(time.time()) + int(t.get("expires_in", 3599))
+        self.token = get_token(cfg["tenant_id"], cfg["client_id"], cfg["client_secret"], cfg["resource"])
 
 # ----- CLI Test -----
 if __name__ == "__main__":
@@ -0,0 +1,106 @@
+"""
+entity_recognizer.py
+--------------------
+
+Finds table mentions in user text in one pass over an Aho-Corasick automaton
+compiled once from the entity map ({display_or_logical: logical}).
+
+- Whole words only: "account" does not match inside "accountnumber"
+  (underscores count as word characters, like \\w).
+- Longest match: overlapping names resolve to the longest one, so "event
+  config" is pshb_eventconfig and its "event" is not a separate mention.
+- Case-insensitive; runs of whitespace in the text match a single space.
+
+best() picks the mention ranked earliest in the entity map (solution tables
+come before org-wide ones there), so results do not depend on dict iteration
+beyond that order.
+
+    recognizer = recognizer_for(entity_map)
+    recognizer.find_all("when an event config is created")
+    # → [EntityMention(logical='pshb_eventconfig', name='event config', start=8, end=20, rank=6)]
+"""
+
+import re
+from typing import Dict, List, NamedTuple
+
+from field_matcher import AhoCorasick
+
+_SPACE = re.compile(r"\s+")
+
+
+class EntityMention(NamedTuple):
+    logical: str
+    name: str
+    start: int          # offsets into the original text
+    end: int
+    rank: int           # position of the name's entry in the entity map
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class EntityRecognizer:
+    def __init__(self, entity_map: Dict[str, str]) -> None:
+        self.names: Dict[str, tuple] = {}                  # name → (logical, rank)
+        for rank, (display, logical) in enumerate(entity_map.items()):
+            for name in (display, logical):
+                key = _SPACE.sub(" ", name.strip().lower())
+                if key:
+                    self.names.setdefault(key, (logical, rank))
+        self._patterns = list(self.names)
+        self._automaton = AhoCorasick(self._patterns)
+
+    def rank(self, name: str) -> int | None:
+        entry = self.names.get(_SPACE.sub(" ", name.strip().lower()))
+        return entry[1] if entry else None
+
+    def find_all(self, text: str) -> List[EntityMention]:
+        """Non-overlapping whole-word mentions, leftmost-longest, in text order."""
+        # collapse whitespace, remembering where each character came from
+        chars, offsets = [], []
+        for m in re.finditer(r"\s+|\S+", text.lower()):
+            if m.group()[0].isspace():
+                chars.append(" ")
+                offsets.append(m.start())
+            else:
+                chars.extend(m.group())
+                offsets.extend(range(m.start(), m.end()))
+        clean = "".join(chars)
+        offsets.append(len(text))
+
+        spans = []
+        for end, pid in self._automaton.iter_matches(clean):
+            start = end - len(self._patterns[pid])
+            if (start == 0 or not _is_word(clean[start - 1])) and \
+                    (end == len(clean) or not _is_word(clean[end])):
+                spans.append((start, -end, pid))
+        spans.sort()
+
+        mentions, covered = [], 0
+        for start, neg_end, pid in spans:
+            if start < covered:
+                continue
+            name = self._patterns[pid]
+            logical, rank = self.names[name]
+            mentions.append(EntityMention(logical, name, offsets[start], offsets[-neg_end - 1] + 1, rank))
+            covered = -neg_end
+        return mentions
+
+    def best(self, text: str) -> EntityMention | None:
+        return min(self.find_all(text), key=lambda m: (m.rank, m.start), default=None)
+
+
+_recognizers: List[tuple] = []          # (entity_map, recognizer), most recent last
+_CACHE_SIZE = 4
+
+
+def recognizer_for(entity_map: Dict[str, str]) -> EntityRecognizer:
+    """Recognizer compiled for this entity_map object (load_entity_map returns cached maps)."""
+    for cached_map, recognizer in _recognizers:
+        if cached_map is entity_map:
+            return recognizer
+    recognizer = EntityRecognizer(entity_map)
+    _recognizers.append((entity_map, recognizer))
+    del _recognizers[:-_CACHE_SIZE]
+    return recognizer
@@ -0,0 +1,397 @@
+"""
+fake_dataverse.py  –  Local Dataverse stand-in for the metadata pipeline
+-----------------------------------------------------------------------
+
+Serves just enough of the Web API for CrmMetadataClient, fetch_entities.py,
+fetch_fields.py and sync_metadata.py to run without a live org:
+
+    /api/data/v9.2/solutions, solutioncomponents
+    /api/data/v9.2/EntityDefinitions[(id) | ?$filter=MetadataId eq ...]
+    /api/data/v9.2/EntityDefinitions(LogicalName='x')/Attributes[/<cast>]
+    /api/data/v9.2/EntityDefinitions(LogicalName='x')/Attributes(LogicalName='y')/<cast>
+    /api/data/v9.2/GlobalOptionSetDefinitions
+    /api/data/v9.2/RetrieveMetadataChanges(...)
+    POST /<tenant>/oauth2/v2.0/token          (client-credentials stub)
+    GET  /_stats   POST /_stats/reset         (request counters)
+
+Fixtures are either synthetic (N tables × M columns) or "recorded" from the
+harvested fields/*.json files.  Latency and 429 throttling can be injected.
+
+Run:
+    python fake_dataverse.py --tables 50 --columns 300 --port 8765
+    python fake_dataverse.py --from-fields fields --latency-ms 40 --throttle-rate 0.05
+"""
+
+import os, re, json, glob, time, uuid, random, argparse, threading
+import requests
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, unquote, parse_qs
+
+API = "/api/data/v9.2"
+
+# AttributeType → typed-cast collection the attribute shows up in
+CASTS = {
+    "Lookup": "LookupAttributeMetadata",
+    "Customer": "LookupAttributeMetadata",
+    "Owner": "LookupAttributeMetadata",
+    "Picklist": "PicklistAttributeMetadata",
+    "MultiSelectPicklist": "MultiSelectPicklistAttributeMetadata",
+    "State": "StateAttributeMetadata",
+    "Status": "StatusAttributeMetadata",
+}
+
+
+# ----------------------------------------------------------------- fixtures
+def _label(text: str) -> dict:
+    return {"LocalizedLabels": [{"Label": text, "LanguageCode": 1033}],
+            "UserLocalizedLabel": {"Label": text, "LanguageCode": 1033}}
+
+
+def _options(opts: list[dict]) -> list[dict]:
+    return [{"Value": o["value"], "Label": _label(o["label"])} for o in opts]
+
+
+def _attribute(logical, display, typ, targets=None, optionset=None, global_name=None) -> dict:
+    attr = {"MetadataId": str(uuid.uuid4()), "LogicalName": logical,
+            "DisplayName": _label(display), "AttributeType": typ}
+    if targets:
+        attr["Targets"] = targets
+    if global_name:
+        attr["GlobalOptionSet"] = global_name
+    elif optionset is not None:
+        attr["Options"] = _options(optionset)
+    return attr
+
+
+def synthetic_fixture(tables: int, columns: int, solution: str = "Bench",
+                      global_sets: int = 5, seed: int = 7) -> dict:
+    """N tables with M columns: mostly strings, plus lookups and local/global choices."""
+    rnd = random.Random(seed)
+    globals_ = {
+        f"bench_choice{g}": _options([{"value": 100000000 + i, "label": f"Choice {g}.{i}"}
+                                      for i in range(8)])
+        for g in range(global_sets)
+    }
+    entities = {}
+    for t in range(tables):
+        logical = f"bench_table{t}"
+        attrs = [
+            _attribute(f"{logical}id", "Id", "Uniqueidentifier"),
+            _attribute("statecode", "Status", "State",
+                       optionset=[{"value": 0, "label": "Active"}, {"value": 1, "label": "Inactive"}]),
+            _attribute("statuscode", "Status Reason", "Status",
+                       optionset=[{"value": 1, "label": "Active"}, {"value": 2, "label": "Inactive"}]),
+        ]
+        for c in range(max(0, columns - len(attrs))):
+            roll = rnd.random()
+            name = f"bench_col{c}"
+            if roll < 0.15:
+                attrs.append(_attribute(name, f"Lookup {c}", "Lookup",
+                                        targets=[f"bench_table{rnd.randrange(tables)}"]))
+            elif roll < 0.22:
+                attrs.append(_attribute(name, f"Choice {c}", "Picklist",
+                                        optionset=[{"value": i, "label": f"Option {i}"} for i in range(5)]))
+            elif roll < 0.30:
+                attrs.append(_attribute(name, f"Shared Choice {c}", "Picklist",
+                                        global_name=f"bench_choice{rnd.randrange(global_sets)}"))
+            elif roll < 0.40:
+                attrs.append(_attribute(name, f"Number {c}", "Integer"))
+            else:
+                attrs.append(_attribute(name, f"Text Column {c}", "String"))
+        entities[logical] = {"MetadataId": str(uuid.uuid4()), "DisplayName": f"Bench Table {t}",
+                             "Attributes": attrs}
+    return {"solutions": {solution: list(entities)}, "entities": entities,
+            "global_optionsets": globals_}
+
+
+def fixture_from_fields(folder: str = "fields", solution: str = "Recorded") -> dict:
+    """Replay harvested fields/<logical>_fields.json files as a fixture."""
+    globals_ = {}
+    global_path = os.path.join(folder, "global_optionsets.json")
+    if os.path.isfile(global_path):
+        with open(global_path, "r", encoding="utf-8") as f:
+            globals_ = {name: _options(opts) for name, opts in json.load(f).items()}
+
+    entities = {}
+    for path in sorted(glob.glob(os.path.join(folder, "*_fields.json"))):
+        logical = os.path.basename(path)[:-len("_fields.json")]
+        with open(path, "r", encoding="utf-8") as f:
+            cols = json.load(f).values()
+        attrs = [_attribute(c["logicalName"], c.get("displayName") or c["logicalName"],
+                            c.get("type", "Unknown"), c.get("targets"),
+                            c.get("optionset") if c.get("type") in CASTS else None,
+                            c.get("globalOptionSet"))
+                 for c in cols]
+        entities[logical] = {"MetadataId": str(uuid.uuid4()), "DisplayName": logical,
+                             "Attributes": attrs}
+    return {"solutions": {solution: list(entities)}, "entities": entities,
+            "global_optionsets": globals_}
+
+
+# ----------------------------------------------------------------- server
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fixture: dict, latency_ms: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0) -> None:
+        super().__init__(address, StandInHandler)
+        self.fixture = fixture
+        self.latency = latency_ms / 1000.0
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.by_id = {e["MetadataId"]: name for name, e in fixture["entities"].items()}
+        self.solution_ids = {name: str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+                             for name in fixture["solutions"]}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind: str) -> None:
+        with self.stats_lock:
+            self.stats[kind] += 1
+            if kind not in ("stats", "token"):
+                self.stats["_api_total"] += 1
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    def log_message(self, *args):      # keep benchmark output clean
+        pass
+
+    # ----- plumbing -----
+    def _send(self, status: int, body: dict | None = None, headers: dict | None = None):
+        payload = json.dumps(body or {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _throttled(self) -> bool:
+        srv = self.server
+        if srv.throttle_rate and random.random() < srv.throttle_rate:
+            srv.count("throttled")
+            self._send(429, {"error": {"code": "0x80072321", "message": "Too many requests"}},
+                       {"Retry-After": str(srv.retry_after)})
+            return True
+        return False
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == "/_stats/reset":
+            with self.server.stats_lock:
+                self.server.stats.clear()
+            return self._send(200, {})
+        if re.fullmatch(r"/[^/]+/oauth2/v2\.0/token", path):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.server.count("token")
+            return self._send(200, {"token_type": "Bearer", "expires_in": 3599,
+                                    "access_token": "stand-in-token"})
+        self._send(404, {"error": {"message": f"no route for POST {path}"}})
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path, query = unquote(parts.path), parse_qs(parts.query)
+        q = {k: v[0] for k, v in query.items()}
+
+        if path == "/_stats":
+            return self._send(200, dict(self.server.stats))
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self._send(401, {"error": {"message": "missing bearer token"}})
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self._throttled():
+            return
+
+        for pattern, handler in ROUTES:
+            m = re.fullmatch(pattern, path)
+            if m:
+                self.server.count(handler.__name__.lstrip("_"))
+                status, body = handler(self.server, q, *m.groups())
+                return self._send(status, body)
+        self._send(404, {"error": {"message": f"no route for GET {path}"}})
+
+
+# ----------------------------------------------------------------- routes
+def _not_found(what: str):
+    return 404, {"error": {"code": "0x80040217", "message": f"{what} not found"}}
+
+
+def _attr_row(srv: StandInServer, attr: dict, expand: str = "", full: bool = False) -> dict:
+    """Typed-cast row; full=True is the RetrieveMetadataChanges shape."""
+    row = {"LogicalName": attr["LogicalName"]}
+    if full:
+        row.update(MetadataId=attr["MetadataId"], DisplayName=attr["DisplayName"],
+                   AttributeType=attr["AttributeType"])
+    cast = CASTS.get(attr["AttributeType"])
+    if cast == "LookupAttributeMetadata":
+        row["Targets"] = attr.get("Targets", [])
+    elif cast:
+        global_name = attr.get("GlobalOptionSet")
+        global_opts = srv.fixture["global_optionsets"].get(global_name, [])
+        if full:
+            row["OptionSet"] = {"Name": global_name or f"{attr['LogicalName']}_options",
+                                "IsGlobal": bool(global_name),
+                                "Options": global_opts if global_name else attr.get("Options", [])}
+        else:
+            row["OptionSet"] = None if global_name else {"Options": attr.get("Options", [])}
+            row["GlobalOptionSet"] = None
+            if global_name:
+                row["GlobalOptionSet"] = {"Name": global_name}
+                if "GlobalOptionSet($select=Options)" in expand:
+                    row["GlobalOptionSet"]["Options"] = global_opts
+    return row
+
+
+def _solutions(srv, q):
+    names = re.findall(r"uniquename eq '([^']+)'", q.get("$filter", ""))
+    return 200, {"value": [{"solutionid": srv.solution_ids[n], "uniquename": n}
+                           for n in names if n in srv.solution_ids]}
+
+
+def _solutioncomponents(srv, q):
+    ids = set(re.findall(r"_solutionid_value eq '([^']+)'", q.get("$filter", "")))
+    rows = []
+    for name, sid in srv.solution_ids.items():
+        if sid in ids:
+            rows += [{"objectid": srv.fixture["entities"][e]["MetadataId"]}
+                     for e in srv.fixture["solutions"][name]]
+    return 200, {"value": rows}
+
+
+def _entity_row(name: str, ent: dict) -> dict:
+    return {"MetadataId": ent["MetadataId"], "LogicalName": name,
+            "DisplayName": _label(ent["DisplayName"])}
+
+
+def _entity_definitions(srv, q):
+    ids = re.findall(r"MetadataId eq ([0-9a-fA-F-]+)", q.get("$filter", ""))
+    names = [srv.by_id[i] for i in ids if i in srv.by_id] if ids else list(srv.fixture["entities"])
+    return 200, {"value": [_entity_row(n, srv.fixture["entities"][n]) for n in names]}
+
+
+def _entity_by_id(srv, q, oid):
+    if oid not in srv.by_id:
+        return _not_found(f"Entity {oid}")
+    name = srv.by_id[oid]
+    return 200, _entity_row(name, srv.fixture["entities"][name])
+
+
+def _attributes(srv, q, table):
+    ent = srv.fixture["entities"].get(table)
+    if ent is None:
+        return _not_found(f"Entity {table}")
+    return 200, {"value": [{"LogicalName": a["LogicalName"], "DisplayName": a["DisplayName"],
+                            "AttributeType": a["AttributeType"]} for a in ent["Attributes"]]}
+
+
+def _attributes_cast(srv, q, table, cast):
+    ent = srv.fixture["entities"].get(table)
+    if ent is None:
+        return _not_found(f"Entity {table}")
+    cast = cast.split(".")[-1]
+    rows = [_attr_row(srv, a, q.get("$expand", "")) for a in ent["Attributes"]
+            if CASTS.get(a["AttributeType"]) == cast]
+    return 200, {"value": rows}
+
+
+def _attribute_cast(srv, q, table, column, cast):
+    ent = srv.fixture["entities"].get(table)
+    attr = next((a for a in (ent or {}).get("Attributes", []) if a["LogicalName"] == column), None)
+    if attr is None or CASTS.get(attr["AttributeType"]) != cast.split(".")[-1]:
+        return _not_found(f"Attribute {table}.{column} as {cast}")
+    return 200, _attr_row(srv, attr, q.get("$expand", ""))
+
+
+def _global_optionsets(srv, q):
+    return 200, {"value": [{"Name": n, "Options": opts}
+                           for n, opts in srv.fixture["global_optionsets"].items()]}
+
+
+def _metadata_changes(srv, q, params):
+    query = json.loads(q.get("@q", "{}"))
+    names = [c["Value"]["Value"] for c in query.get("Criteria", {}).get("Conditions", [])]
+    stamp = f"stand-in!{int(time.time())}"
+    # with a stamp, only the columns listed in fixture["changed"] ({table: [column, ...]})
+    changed = srv.fixture.get("changed", {}) if q.get("@s") else None
+    ents = []
+    for name in names:
+        ent = srv.fixture["entities"].get(name)
+        if not ent or (changed is not None and name not in changed):
+            continue
+        attrs = [a for a in ent["Attributes"] if changed is None or a["LogicalName"] in changed[name]]
+        ents.append({"MetadataId": ent["MetadataId"], "LogicalName": name,
+                     "Attributes": [_attr_row(srv, a, full=True) for a in attrs]})
+    return 200, {"EntityMetadata": ents, "ServerVersionStamp": stamp, "DeletedMetadata": {}}
+
+
+ROUTES = [
+    (rf"{API}/solutions", _solutions),
+    (rf"{API}/solutioncomponents", _solutioncomponents),
+    (rf"{API}/EntityDefinitions", _entity_definitions),
+    (rf"{API}/EntityDefinitions\(([0-9a-fA-F-]+)\)", _entity_by_id),
+    (rf"{API}/EntityDefinitions\(LogicalName='([^']+)'\)/Attributes", _attributes),
+    (rf"{API}/EntityDefinitions\(LogicalName='([^']+)'\)/Attributes/([\w.]+)", _attributes_cast),
+    (rf"{API}/EntityDefinitions\(LogicalName='([^']+)'\)/Attributes\(LogicalName='([^']+)'\)/([\w.]+)",
+     _attribute_cast),
+    (rf"{API}/GlobalOptionSetDefinitions", _global_optionsets),
+    (rf"{API}/RetrieveMetadataChanges\((.*)\)", _metadata_changes),
+]
+
+
+# ----------------------------------------------------------------- MSAL stand-in
+class StandInTokenApp:
+    """
+    Drop-in for msal.ConfidentialClientApplication (MSAL only accepts https
+    authorities): posts the client-credentials grant to the stand-in.
+    Use via TokenBroker(authority_host=server.url, app_factory=StandInTokenApp).
+    """
+
+    def __init__(self, client_id, authority, client_credential, token_cache=None):
+        self.client_id = client_id
+        self.secret = client_credential
+        self.token_url = f"{authority}/oauth2/v2.0/token"
+
+    def acquire_token_for_client(self, scopes):
+        resp = requests.post(self.token_url, data={
+            "grant_type": "client_credentials", "client_id": self.client_id,
+            "client_secret": self.secret, "scope": " ".join(scopes)})
+        return resp.json()
+
+
+def serve(fixture: dict, host: str = "127.0.0.1", port: int = 0, **kwargs) -> StandInServer:
+    """Start the stand-in on a daemon thread and return the server."""
+    srv = StandInServer((host, port), fixture, **kwargs)
+    threading.Thread(target=srv.serve_forever, name="fake-dataverse", daemon=True).start()
+    return srv
+
+
+# ----- CLI -----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Dataverse metadata stand-in.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tables", type=int, default=20)
+    parser.add_argument("--columns", type=int, default=200)
+    parser.add_argument("--from-fields", metavar="FOLDER",
+                        help="replay harvested fields/*.json instead of synthetic tables")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="fraction of API requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fixture = (fixture_from_fields(args.from_fields) if args.from_fields
+               else synthetic_fixture(args.tables, args.columns))
+    srv = StandInServer(("127.0.0.1", args.port), fixture, latency_ms=args.latency_ms,
+                        throttle_rate=args.throttle_rate, retry_after=args.retry_after)
+    print(f"Dataverse stand-in on {srv.url} – {len(fixture['entities'])} tables, "
+          f"solution(s): {', '.join(fixture['solutions'])}")
+    srv.serve_forever()
@@ -1,7 +1,10 @@
 # fetch_entities.py
 import json
+import time
+import argparse
 import requests
-from msal import ConfidentialClientApplication
+from token_broker import get_token as broker_token
+from crm_metadata_client import MAX_THROTTLE_RETRIES
 
 def load_crm_config(path="crm_config.json"):
     with open(path, "r") as f:
@@ -12,58 +15,113 @@ def load_solution_config(path="solution_config.json"):
         return json.load(f)
 
 def get_token(cfg):
-    app = ConfidentialClientApplication(
-        cfg["client_id"],
-        authority=f"https://login.microsoftonline.com/{cfg['tenant_id']}",
-        client_credential=cfg["client_secret"],
-    )
-    result = app.acquire_token_for_client(scopes=[f"{cfg['resource']}/.default"])
-    if "access_token" not in result:
-        raise Exception(f"Failed to acquire token: {result}")
-    return result["access_token"]
+    return broker_token(cfg["tenant_id"], cfg["client_id"], cfg["client_secret"], cfg["resource"])
 
-def fetch_entities_for_solution(solution_unique_name):
+# Logical/display names of every table in the org (lazy catalog for the chat app)
+ENVIRONMENT_MAP_PATH = "environment_entity_map.json"
+
+# MetadataIds per filtered EntityDefinitions request (keeps the URL short)
+ENTITY_FILTER_CHUNK = 50
+
+def get_all(url, headers):
+    """GET an OData collection, following @odata.nextLink pages and 429 retries."""
+    rows = []
+    while url:
+        # service protection limit – wait as instructed and retry the page,
+        # MAX_THROTTLE_RETRIES times at most; a 429 after that is raised
+        for _ in range(MAX_THROTTLE_RETRIES):
+            res = requests.get(url, headers=headers)
+            if res.status_code != 429:
+                break
+            time.sleep(float(res.headers.get("Retry-After", 1)))
+        res.raise_for_status()
+        body = res.json()
+        rows.extend(body["value"])
+        url = body.get("@odata.nextLink")
+    return rows
+
+def fetch_entities_for_solutions(solution_unique_names):
+    """
+    Entities of one or more solutions as {metadataid: (logical, display)}.
+    Tables present in several solutions appear once.
+    """
     cfg = load_crm_config()
     token = get_token(cfg)
-    sol_url = f"{cfg['resource']}/api/data/v9.2/solutions?$filter=uniquename eq '{solution_unique_name}'&$select=solutionid"
+    api = f"{cfg['resource']}/api/data/v9.2"
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    res = requests.get(sol_url, headers=headers)
-    res.raise_for_status()
-    solutions = res.json()["value"]
-    if not solutions:
-        raise Exception(f"No solution found for unique name: {solution_unique_name}")
-    solution_id = solutions[0]["solutionid"]
+
+    name_filter = " or ".join(f"uniquename eq '{n}'" for n in solution_unique_names)
+    solutions = get_all(f"{api}/solutions?$filter={name_filter}&$select=solutionid,uniquename", headers)
+    missing = set(solution_unique_names) - {s["uniquename"] for s in solutions}
+    if missing:
+        raise Exception(f"No solution found for unique name: {', '.join(sorted(missing))}")
 
     # Use _solutionid_value for the lookup
-    url = f"{cfg['resource']}/api/data/v9.2/solutioncomponents?$filter=_solutionid_value eq '{solution_id}' and componenttype eq 1&$select=objectid"
-    res = requests.get(url, headers=headers)
-    res.raise_for_status()
-    entity_objectids = [sc["objectid"] for sc in res.json()["value"]]
-    print(f"Found {len(entity_objectids)} entity components in solution.")
+    id_filter = " or ".join(f"_solutionid_value eq '{s['solutionid']}'" for s in solutions)
+    components = get_all(
+        f"{api}/solutioncomponents?$filter=({id_filter}) and componenttype eq 1&$select=objectid",
+        headers)
+    entity_objectids = list(dict.fromkeys(sc["objectid"] for sc in components))
+    print(f"Found {len(entity_objectids)} entity components in {len(solutions)} solution(s).")
 
-    # Now fetch display/logical names for those entities
+    # Resolve display/logical names with filtered EntityDefinitions queries
     entities = {}
-    for oid in entity_objectids:
-        ent_url = f"{cfg['resource']}/api/data/v9.2/EntityDefinitions({oid})?$select=LogicalName,DisplayName"
-        res2 = requests.get(ent_url, headers=headers)
-        res2.raise_for_status()
-        ent = res2.json()
-        logical = ent["LogicalName"]
-        display = ent["DisplayName"]["UserLocalizedLabel"]["Label"] if ent["DisplayName"] and ent["DisplayName"].get("UserLocalizedLabel") else logical
-        entities[oid] = (logical, display)
-    return entities
+    for i in range(0, len(entity_objectids), ENTITY_FILTER_CHUNK):
+        chunk = entity_objectids[i:i + ENTITY_FILTER_CHUNK]
+        oid_filter = " or ".join(f"MetadataId eq {oid}" for oid in chunk)
+        for ent in get_all(
+                f"{api}/EntityDefinitions?$select=MetadataId,LogicalName,DisplayName&$filter={oid_filter}",
+                headers):
+            entities[ent["MetadataId"]] = (ent["LogicalName"], display_name(ent))
+    # keep solution component order
+    return {oid: entities[oid] for oid in entity_objectids if oid in entities}
+
+def fetch_entities_for_solution(solution_unique_name):
+    return fetch_entities_for_solutions([solution_unique_name])
+
+def fetch_environment_entities():
+    """Every non-private table in the org as {metadataid: (logical, display)} – one query."""
+    cfg = load_crm_config()
+    token = get_token(cfg)
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    url = (f"{cfg['resource']}/api/data/v9.2/EntityDefinitions"
+           "?$select=MetadataId,LogicalName,DisplayName&$filter=IsPrivate eq false")
+    return {ent["MetadataId"]: (ent["LogicalName"], display_name(ent)) for ent in get_all(url, headers)}
+
+def display_name(ent):
+    logical = ent["LogicalName"]
+    return ent["DisplayName"]["UserLocalizedLabel"]["Label"] if ent["DisplayName"] and ent["DisplayName"].get("UserLocalizedLabel") else logical
+
+def build_entity_map(entities):
+    """{display_lower / logical_lower: logical} for utils.extract_requirements."""
+    entity_map = {}
+    for metadataid, (ln, dn) in entities.items():
+        entity_map[ln.lower()] = ln
+        entity_map[dn.lower()] = ln
+    return entity_map
 
 if __name__ == "__main__":
-    solution_cfg = load_solution_config()
-    entities = fetch_entities_for_solution(solution_cfg["solution_unique_name"])
+    parser = argparse.ArgumentParser(description="Fetch the tables of one or more solutions.")
+    parser.add_argument("solutions", nargs="*",
+                        help="solution unique names (default: solution_config.json)")
+    parser.add_argument("--environment", action="store_true",
+                        help=f"write the org-wide table catalog to {ENVIRONMENT_MAP_PATH} instead")
+    args = parser.parse_args()
+
+    if args.environment:
+        entity_map = build_entity_map(fetch_environment_entities())
+        with open(ENVIRONMENT_MAP_PATH, "w") as f:
+            json.dump(entity_map, f, indent=2)
+        print(f"{ENVIRONMENT_MAP_PATH} saved ({len(set(entity_map.values()))} tables)!")
+        raise SystemExit
+
+    solution_names = args.solutions or [load_solution_config()["solution_unique_name"]]
+    entities = fetch_entities_for_solutions(solution_names)
     # Save both dict and a simpler entity_map.json if you want
     with open("solution_entities.json", "w") as f:
         json.dump(entities, f, indent=2)
     # Build a display/logical map if you still need it elsewhere
-    entity_map = {}
-    for metadataid, (ln, dn) in entities.items():
-        entity_map[ln.lower()] = ln
-        entity_map[dn.lower()] = ln
+    entity_map = build_entity_map(entities)
     with open("entity_map.json", "w") as f:
         json.dump(entity_map, f, indent=2)
     print("Entity map and solution_entities.json saved!")
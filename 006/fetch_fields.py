@@ -11,12 +11,34 @@ fetch_fields.py  –  Build one JSON file per table with full column metadata
 • Writes  fields/<logical>_fields.json   where each file is
       { logicalName_lower : {logicalName, displayName, type, targets} }
 
+• Columns are normalized before writing (field_normalizer.py): the
+  "<column>name" / "<column>yominame" / "<column>type" shadow columns
+  Dataverse adds next to lookups and choices are dropped.
+
+• Global choices are downloaded once per harvest: columns that use one
+  store  "globalOptionSet": "<name>"  and the options themselves go to
+  fields/global_optionsets.json   { name : [{value, label}, ...] }
+  (options also carry "localizedLabels": {lcid: label} in multi-language orgs)
+
+• Also writes every table into the SQLite metadata store (metadata.db),
+  see metadata_store.py
+
+• Tables are harvested concurrently by a bounded thread pool sharing one
+  authenticated client; each file is written as soon as its table completes.
+
 Run:
-    python fetch_fields.py
+    python fetch_fields.py              # 8 workers
+    python fetch_fields.py --workers 1  # one table at a time
 """
 
-import os, json, traceback
+import os, json, time, argparse, traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from crm_metadata_client import CrmMetadataClient
+from metadata_store import MetadataStore, GLOBAL_OPTIONSETS_FILE
+from field_normalizer import normalize_fields
+from file_cache import write_json
+
+DEFAULT_WORKERS = 8
 
 
 # ----------------------------------------------------------------- helpers
@@ -27,26 +49,89 @@ def load_solution_entities(path: str = "solution_entities.json") -> dict:
     return json.load(open(path, "r", encoding="utf-8"))
 
 
-def save_field_file(logical: str, attrs: list[dict]):
+def save_field_file(logical: str, attrs: list[dict], store: MetadataStore | None = None) -> dict:
+    """Write the table's field file (and store rows); returns the fields saved."""
+    os.makedirs("fields", exist_ok=True)
+    # map by lower-case logical for easy lookup later, without shadow columns
+    field_map = normalize_fields({f["logicalName"].lower(): f for f in attrs})
+    write_json(f"fields/{logical}_fields.json", field_map)
+    if store is not None:
+        store.write_entity(logical, list(field_map.values()))
+    return field_map
+
+
+def save_global_optionsets(client: CrmMetadataClient, names: set[str],
+                           store: MetadataStore | None = None):
+    """Write the global choices referenced by harvested columns."""
+    write_global_optionsets(
+        {n: opts for n, opts in client.get_global_optionsets().items() if n in names}, store)
+
+
+def write_global_optionsets(optionsets: dict, store: MetadataStore | None = None):
+    """Merge {name: options} into fields/global_optionsets.json (and the store)."""
     os.makedirs("fields", exist_ok=True)
-    # map by lower-case logical for easy lookup later
-    field_map = {f["logicalName"].lower(): f for f in attrs}
-    with open(f"fields/{logical}_fields.json", "w", encoding="utf-8") as f:
-        json.dump(field_map, f, indent=2)
+    path = os.path.join("fields", GLOBAL_OPTIONSETS_FILE)
+    existing = {}
+    if os.path.isfile(path):
+        existing = json.load(open(path, "r", encoding="utf-8"))
+    existing.update(optionsets)
+    write_json(path, existing)
+    if store is not None:
+        store.write_global_optionsets(optionsets)
+
+
+def harvest_table(client: CrmMetadataClient, logical: str,
+                  store: MetadataStore | None = None, bulk: bool = True) -> list[dict]:
+    """Fetch and save one table; returns the columns written (shadow columns dropped)."""
+    cols = client.get_attributes(logical, bulk=bulk, global_refs=True)
+    return list(save_field_file(logical, cols, store).values())
+
+
+def harvest(client: CrmMetadataClient, logicals: list[str],
+            workers: int = DEFAULT_WORKERS, store: MetadataStore | None = None,
+            bulk: bool = True) -> dict:
+    """
+    Harvest every table in *logicals* with at most *workers* in flight.
+    Prints one line per table as it finishes and returns
+    { "saved": {logical: n_columns}, "failed": {logical: error} }.
+    """
+    saved, failed = {}, {}
+    global_names = set()
+    total = len(logicals)
+    started = time.time()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(harvest_table, client, lg, store, bulk): lg for lg in logicals}
+        for done, fut in enumerate(as_completed(futures), start=1):
+            logical = futures[fut]
+            try:
+                cols = fut.result()
+                saved[logical] = len(cols)
+                global_names.update(c["globalOptionSet"] for c in cols if c.get("globalOptionSet"))
+                print(f"[{done}/{total}] ✓  {logical}  "
+                      f"→ fields/{logical}_fields.json ({saved[logical]} columns)")
+            except Exception as exc:
+                failed[logical] = str(exc)
+                print(f"[{done}/{total}] ✗  {logical}  failed: {exc}")
+                traceback.print_exc()
+
+    if global_names:
+        save_global_optionsets(client, global_names, store)
+        print(f"   ✓  {len(global_names)} global option sets → fields/{GLOBAL_OPTIONSETS_FILE}")
+
+    print(f"Done in {time.time() - started:.1f}s – "
+          f"{len(saved)} saved, {len(failed)} failed.")
+    return {"saved": saved, "failed": failed}
 
 
 # ----------------------------------------------------------------- main
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Harvest column metadata per table.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"tables fetched in parallel (default {DEFAULT_WORKERS})")
+    args = parser.parse_args()
+
     client = CrmMetadataClient()            # loads crm_config.json + token
     entities = load_solution_entities()     # metadataid → [logical, display]
 
-    for _, (logical, _) in entities.items():
-        print(f"▶  {logical}")
-        try:
-            cols = client.get_attributes(logical)
-            save_field_file(logical, cols)
-            print(f"   ✓  saved fields/{logical}_fields.json "
-                  f"({len(cols)} columns)")
-        except Exception as exc:
-            print(f"   ✗  failed: {exc}")
-            traceback.print_exc()
+    harvest(client, [logical for logical, _ in entities.values()], args.workers, MetadataStore())
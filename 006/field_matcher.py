@@ -0,0 +1,134 @@
+"""
+field_matcher.py
+----------------
+
+Precompiled field matcher for utils.extract_fields_from_text.
+
+FieldMatcher compiles the normalized display/logical names of a field map
+into one Aho-Corasick automaton, so every mention in a user message is
+found in a single linear pass instead of a substring test per name.
+Results are identical to the original two-pass loop: logical names in
+field-map order, de-duplicated.
+
+FieldMap is the dict returned by utils.load_field_map; it builds its matcher
+on first use and keeps it, so the automaton lives as long as the loaded map.
+Treat a FieldMap as read-only once loaded.
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]")
+
+
+def normalize(text):
+    """Normalize for matching (lowercase, strip, remove non-alphanum)."""
+    return _NON_ALNUM.sub("", text.lower())
+
+
+class AhoCorasick:
+    """Multi-pattern substring search; find() returns the ids of patterns present."""
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]     # pattern ids ending exactly here
+        self._dict_link: List[int] = [0]      # nearest fail-chain state with output (0 = none)
+
+        for pid, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._dict_link.append(0)
+                state = nxt
+            self._out[state].append(pid)
+
+        # breadth-first: failure links and output (dictionary suffix) links
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = fail
+                self._dict_link[nxt] = fail if self._out[fail] else self._dict_link[fail]
+                queue.append(nxt)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(end, pattern id) for every occurrence in text; end is exclusive."""
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] else dict_link[state]
+            while s:
+                for pid in out[s]:
+                    yield i + 1, pid
+                s = dict_link[s]
+
+    def find(self, text: str) -> Set[int]:
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        found: Set[int] = set()
+        seen: Set[int] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            # each state's output chain only needs collecting once
+            s = state
+            while s and s not in seen:
+                seen.add(s)
+                found.update(out[s])
+                s = dict_link[s]
+        return found
+
+
+class FieldMatcher:
+    def __init__(self, field_map: Dict[str, str]) -> None:
+        self.logicals = list(field_map.values())
+        by_pattern: Dict[str, List[int]] = {}
+        # names that normalize to "" can only match as raw substrings
+        self._raw_only: List[tuple] = []
+        for i, (display, logical) in enumerate(field_map.items()):
+            for name in (display, logical):
+                norm = normalize(name)
+                if norm:
+                    by_pattern.setdefault(norm, []).append(i)
+                else:
+                    self._raw_only.append((i, name))
+        self._pattern_keys = list(by_pattern.values())
+        self._automaton = AhoCorasick(by_pattern)
+
+    def find(self, text: str) -> List[str]:
+        hits: Set[int] = set()
+        for pid in self._automaton.find(normalize(text)):
+            hits.update(self._pattern_keys[pid])
+        found = list(dict.fromkeys(self.logicals[i] for i in sorted(hits)))
+        if self._raw_only:
+            lower = text.lower()
+            for i, name in self._raw_only:
+                if name in lower and self.logicals[i] not in found:
+                    found.append(self.logicals[i])
+        return found
+
+
+class FieldMap(dict):
+    """{display_or_logical_lower: logical} with its compiled matcher attached."""
+
+    _matcher: FieldMatcher | None = None
+
+    @property
+    def matcher(self) -> FieldMatcher:
+        if self._matcher is None:
+            self._matcher = FieldMatcher(self)
+        return self._matcher
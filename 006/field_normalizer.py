@@ -0,0 +1,73 @@
+"""
+field_normalizer.py
+-------------------
+
+Normalization pass over harvested column metadata, run when field files are
+written (fetch_fields.save_field_file) and when they load
+(utils.load_fields_dict).
+
+- Shadow columns are dropped. Dataverse adds a read-only companion for most
+  lookup, choice and yes/no columns: "<parent>name" (formatted value / lookup
+  name), "<parent>yominame" (phonetic lookup name) and "<parent>type" (lookup
+  target table). They carry no display name of their own, so their displayName
+  equals their logical name; they are recognized by that, the suffix, and the
+  parent column being present. Derived data only – the parent is the column
+  rules read and write.
+- Repeated strings (logical names, types, targets, option labels) are interned.
+- Identical option sets share one list, across tables too when the calls
+  share a `pool`, so option_index builds one OptionIndex per distinct set.
+  utils keeps its pool in metadata_cache, so a refresh of the field files
+  or the metadata store starts a new one.
+
+    fields = normalize_fields(json.load(f), pool)     # {logical_lower: info}
+"""
+
+import sys
+from typing import Any, Dict, List
+
+SHADOW_SUFFIXES = ("yominame", "name", "type")       # longest first
+
+
+def shadow_parent(logical: str, info: Dict[str, Any], fields: Dict[str, Dict[str, Any]]) -> str | None:
+    """Logical name of the column `logical` shadows, or None for a real column."""
+    if (info.get("displayName") or logical).lower() != logical:
+        return None
+    for suffix in SHADOW_SUFFIXES:
+        parent = logical[:-len(suffix)]
+        if logical.endswith(suffix) and parent in fields:
+            return parent
+    return None
+
+
+def normalize_fields(fields: Dict[str, Dict[str, Any]],
+                     pool: Dict[tuple, List[Dict[str, Any]]] | None = None) -> Dict[str, Dict[str, Any]]:
+    """
+    {logical_lower: info} without shadow columns, with interned strings and
+    option sets shared through `pool` (option set key → list; one per call without it).
+    """
+    pool = {} if pool is None else pool
+    out = {}
+    for logical, info in fields.items():
+        if shadow_parent(logical, info, fields) is not None:
+            continue
+        info = dict(info)
+        for key in ("logicalName", "displayName", "type", "globalOptionSet"):
+            if isinstance(info.get(key), str):
+                info[key] = sys.intern(info[key])
+        if info.get("targets"):
+            info["targets"] = [sys.intern(t) for t in info["targets"]]
+        if info.get("optionset"):
+            info["optionset"] = shared_optionset(info["optionset"], pool)
+        out[sys.intern(logical)] = info
+    return out
+
+
+def shared_optionset(optionset: List[Dict[str, Any]],
+                     pool: Dict[tuple, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """The one list in `pool` holding these options (treat it as read-only)."""
+    key = tuple((o["value"], o["label"], tuple(sorted((o.get("localizedLabels") or {}).items())))
+                for o in optionset)
+    shared = pool.get(key)
+    if shared is None:
+        shared = pool[key] = [dict(o, label=sys.intern(o["label"])) for o in optionset]
+    return shared
@@ -0,0 +1,162 @@
+"""
+field_ranker.py
+---------------
+
+Scores candidate fields against the user's text so a single best field can be
+chosen in-process instead of asking the LLM.
+
+Each display/logical name of a field is scored in tiers, like test.py:
+    exact       normalized name equals the normalized text
+    word        name appears as whole word(s) in the text
+    word_start  a word in the text starts with the name ('email' → 'emailaddress1')
+    substring   normalized name occurs anywhere in the normalized text
+    table_name  the name is also the table's own name ('Account' on account),
+                which in a request almost always refers to the table
+plus a trigram similarity between the name and the closest run of words in
+the text, and a small bonus for names covering more of the text. A field's
+score is that of its best name.
+
+Longest match wins: a field whose matched name only occurs inside the match
+of a longer one ("status" in "status reason", "event" in "event config") is
+dropped before the margin applies, since the text names the longer field.
+
+pick_field() returns the top field when it leads the runner-up by at least
+FIELD_MATCH_MARGIN; otherwise the caller should ask the LLM about the
+close_candidates().
+"""
+
+import os, re
+from typing import Dict, Iterable, List, NamedTuple
+
+from field_matcher import normalize
+
+MARGIN = float(os.getenv("FIELD_MATCH_MARGIN", "0.15"))
+
+TIER_WEIGHTS = {"exact": 1.0, "word": 0.8, "word_start": 0.6, "substring": 0.4, "table_name": 0.3}
+SIMILARITY_WEIGHT = 0.2
+COVERAGE_WEIGHT = 0.1
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class RankedField(NamedTuple):
+    logical: str
+    score: float
+    tier: str
+    name: str
+
+
+def trigrams(text: str) -> set:
+    padded = f"#{text}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a: set, b: set) -> float:
+    return 2 * len(a & b) / (len(a) + len(b)) if a and b else 0.0
+
+
+class _Text:
+    """The user's text, pre-split once for scoring many names."""
+
+    def __init__(self, text: str) -> None:
+        self.norm = normalize(text)
+        self.words = _WORD.findall(text.lower())
+        self.word_set = set(self.words)
+        self._windows: Dict[int, List[set]] = {}
+
+    def windows(self, size: int) -> List[set]:
+        """Trigram sets of every run of `size` consecutive words."""
+        if size not in self._windows:
+            self._windows[size] = [trigrams("".join(self.words[i:i + size]))
+                                   for i in range(max(len(self.words) - size + 1, 1))]
+        return self._windows[size]
+
+    def spans(self, norm: str) -> List[tuple]:
+        """(start, end) of every occurrence of `norm` in the normalized text."""
+        out, start = [], self.norm.find(norm)
+        while start >= 0 and norm:
+            out.append((start, start + len(norm)))
+            start = self.norm.find(norm, start + 1)
+        return out
+
+    def has_phrase(self, words: List[str]) -> bool:
+        n = len(words)
+        if n == 1:
+            return words[0] in self.word_set
+        return any(self.words[i:i + n] == words for i in range(len(self.words) - n + 1))
+
+
+def _score_name(name: str, text: _Text, table_names: set):
+    norm = normalize(name)
+    if not norm:
+        return 0.0, ""
+    words = _WORD.findall(name.lower())
+    if norm in table_names and norm != text.norm:
+        tier = "table_name" if norm in text.norm else ""
+    elif norm == text.norm:
+        tier = "exact"
+    elif text.has_phrase(words):
+        tier = "word"
+    elif any(w.startswith(norm) for w in text.words):
+        tier = "word_start"
+    elif norm in text.norm:
+        tier = "substring"
+    else:
+        tier = ""
+    if not tier:
+        return 0.0, ""
+    grams = trigrams(norm)
+    similarity = max(dice(grams, w) for w in text.windows(len(words) or 1))
+    coverage = len(norm) / max(len(text.norm), 1)
+    return TIER_WEIGHTS[tier] + SIMILARITY_WEIGHT * similarity + COVERAGE_WEIGHT * coverage, tier
+
+
+def rank_fields(field_map: Dict[str, str], text: str, candidates: Iterable[str] | None = None,
+                table_names: Iterable[str] = ()) -> List[RankedField]:
+    """
+    Fields with any hit, best first; ties keep field_map (or candidates) order.
+    table_names: display/logical names of the table itself (see the table_name tier).
+    """
+    table_names = {normalize(n) for n in table_names}
+    wanted = None if candidates is None else list(candidates)
+    names: Dict[str, List[str]] = {logical: [] for logical in wanted or ()}
+    for name, logical in field_map.items():
+        if wanted is None or logical in names:
+            names.setdefault(logical, []).append(name)
+            if logical not in names[logical]:
+                names[logical].append(logical)
+
+    scored = _Text(text)
+    ranked = []
+    for logical, field_names in names.items():
+        best = max((_score_name(n, scored, table_names) + (n,) for n in field_names), default=(0.0, "", ""))
+        if best[0] > 0:
+            ranked.append(RankedField(logical, round(best[0], 4), best[1], best[2]))
+    ranked = _longest_matches(ranked, scored)
+    ranked.sort(key=lambda r: -r.score)
+    return ranked
+
+
+def _longest_matches(ranked: List[RankedField], text: _Text) -> List[RankedField]:
+    """Drop fields whose name occurs only inside the occurrences of a longer matched name."""
+    spans = {r.logical: text.spans(normalize(r.name)) for r in ranked}
+
+    def inside(inner: List[tuple], outer: List[tuple]) -> bool:
+        return bool(inner) and all(any(s >= a and e <= b for a, b in outer) for s, e in inner)
+
+    return [r for r in ranked
+            if not any(len(normalize(o.name)) > len(normalize(r.name)) and inside(spans[r.logical], spans[o.logical])
+                       for o in ranked)]
+
+
+def close_candidates(ranked: List[RankedField], margin: float = MARGIN) -> List[str]:
+    """The top field and every field scoring within `margin` of it."""
+    if not ranked:
+        return []
+    return [r.logical for r in ranked if ranked[0].score - r.score < margin]
+
+
+def pick_field(ranked: List[RankedField], margin: float = MARGIN) -> str | None:
+    """The top field if it is a clear winner, else None."""
+    close = close_candidates(ranked, margin)
+    return close[0] if len(close) == 1 else None
@@ -0,0 +1,89 @@
+"""
+file_cache.py
+-------------
+
+Process-wide LRU cache for values loaded from files on disk.
+
+Each entry remembers the (mtime, size) of the files it was built from and is
+reloaded as soon as one of them changes, appears or disappears, so a metadata
+refresh is picked up without restarting the app. Cached values are shared
+between callers: treat them as read-only.
+
+Usage:
+    cache = MtimeCache(maxsize=128)
+    value = cache.get(("fields", "account"), ["fields/account_fields.json"], loader)
+    cache.stats()   # {"hits": .., "misses": .., "invalidations": .., "evictions": .., "size": ..}
+
+Files that other workers read while they are rewritten go through
+write_json(), which swaps in a complete file, so a reader never loads a
+half-written one.
+"""
+
+import os, json, tempfile, threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Tuple
+
+
+def _signature(paths: Iterable[str]) -> Tuple:
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append((path, None, None))
+    return tuple(sig)
+
+
+def write_json(path: str, data: Any, indent: int | None = 2) -> None:
+    """Write `data` to a temp file next to `path`, then rename it into place."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=indent)
+        os.chmod(tmp, 0o644)                # mkstemp creates 0600
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class MtimeCache:
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = self.evictions = 0
+
+    def get(self, key: Hashable, paths: Iterable[str], loader: Callable[[], Any]) -> Any:
+        sig = _signature(paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self.invalidations += 1
+
+        # load outside the lock; concurrent misses on one key just load twice
+        value = loader()
+        with self._lock:
+            self._entries[key] = (sig, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "invalidations": self.invalidations, "evictions": self.evictions,
+                    "size": len(self._entries), "maxsize": self.maxsize}
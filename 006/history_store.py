@@ -0,0 +1,182 @@
+"""
+history_store.py
+----------------
+
+Code generation history per chat session, replacing app.py's in-process
+defaultdict(list): bounded, durable, and shared by every gunicorn worker.
+
+    history = get_history_store()                 # $HISTORY_BACKEND: sqlite (default) | memory
+    history.append(session_id, {"timestamp": ..., "entity": ..., "code": ...})
+    history.latest(session_id)                    # newest entry or None
+    history.page(session_id, limit=20)            # {"items": [...newest first], "next": cursor}
+    history.page(session_id, limit=20, before=cursor)
+
+SQLiteHistoryStore (history.db or $HISTORY_DB) keeps one row per entry,
+indexed by (session_id, timestamp), with the code zlib-compressed. Every
+append enforces the retention caps: the newest HISTORY_PER_SESSION entries
+of a session and the newest HISTORY_MAX_ENTRIES overall are kept. Pages are
+keyset-paginated on the entry id, so deep pages cost the same as the first.
+
+MemoryHistoryStore applies the same caps in process (tests, single worker).
+"""
+
+import os, json, zlib, sqlite3, threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Dict, List
+
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_PATH = os.getenv("HISTORY_DB", "history.db")
+HISTORY_PER_SESSION = int(os.getenv("HISTORY_PER_SESSION", "50"))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "10000"))
+SCHEMA_VERSION = 1
+
+# entry keys stored in their own columns; "code" is compressed, "related" JSON
+FIELDS = ("timestamp", "plugin_name", "entity", "trigger", "fields", "logic")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id  TEXT NOT NULL,
+    timestamp   TEXT NOT NULL,
+    plugin_name TEXT,
+    entity      TEXT,
+    trigger     TEXT,
+    fields      TEXT,
+    logic       TEXT,
+    related     TEXT,
+    code        BLOB
+);
+CREATE INDEX IF NOT EXISTS ix_history_session ON history (session_id, timestamp);
+"""
+
+
+class HistoryStore(ABC):
+    """Backend interface; entries are dicts as built by app._save_code_history."""
+
+    def __init__(self, per_session: int = HISTORY_PER_SESSION, max_entries: int = HISTORY_MAX_ENTRIES) -> None:
+        self.per_session = per_session
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def append(self, session_id: str, entry: Dict[str, Any]) -> int:
+        """Store an entry and apply the retention caps; returns its id."""
+
+    @abstractmethod
+    def page(self, session_id: str, limit: int = 20, before: int | None = None) -> Dict[str, Any]:
+        """{"items": up to `limit` entries newest first, older than id `before`; "next": cursor or None}."""
+
+    @abstractmethod
+    def count(self, session_id: str) -> int:
+        """Entries kept for the session."""
+
+    def latest(self, session_id: str) -> Dict[str, Any] | None:
+        items = self.page(session_id, limit=1)["items"]
+        return items[0] if items else None
+
+
+class MemoryHistoryStore(HistoryStore):
+    def __init__(self, per_session: int = HISTORY_PER_SESSION, max_entries: int = HISTORY_MAX_ENTRIES) -> None:
+        super().__init__(per_session, max_entries)
+        self._sessions: Dict[str, deque] = {}
+        self._order: OrderedDict = OrderedDict()        # id → session_id, oldest first
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def append(self, session_id: str, entry: Dict[str, Any]) -> int:
+        with self._lock:
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            entries = self._sessions.setdefault(session_id, deque())
+            entries.append({**entry, "id": entry_id})
+            self._order[entry_id] = session_id
+            while len(entries) > self.per_session:
+                self._order.pop(entries.popleft()["id"], None)
+            while len(self._order) > self.max_entries:
+                oldest_id, oldest_session = self._order.popitem(last=False)
+                oldest = self._sessions[oldest_session]
+                oldest.popleft()
+                if not oldest:
+                    del self._sessions[oldest_session]
+            return entry_id
+
+    def page(self, session_id: str, limit: int = 20, before: int | None = None) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._sessions.get(session_id, ()))
+        items = [e for e in reversed(entries) if before is None or e["id"] < before][:limit + 1]
+        return _page(items, limit)
+
+    def count(self, session_id: str) -> int:
+        return len(self._sessions.get(session_id, ()))
+
+
+class SQLiteHistoryStore(HistoryStore):
+    def __init__(self, path: str = HISTORY_PATH, per_session: int = HISTORY_PER_SESSION,
+                 max_entries: int = HISTORY_MAX_ENTRIES) -> None:
+        super().__init__(per_session, max_entries)
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS history")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+
+    def append(self, session_id: str, entry: Dict[str, Any]) -> int:
+        row = ([session_id] + [entry.get(k) for k in FIELDS] +
+               [json.dumps(entry.get("related") or []), zlib.compress((entry.get("code") or "").encode("utf-8"))])
+        conn = self._conn()
+        with conn:
+            entry_id = conn.execute(
+                "INSERT INTO history (session_id, timestamp, plugin_name, entity, trigger, fields, logic, "
+                "related, code) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row).lastrowid
+            # retention: newest per_session of this session, newest max_entries overall
+            conn.execute(
+                "DELETE FROM history WHERE session_id = ? AND id <= ("
+                "SELECT id FROM history WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, self.per_session))
+            conn.execute(
+                "DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.max_entries,))
+        return entry_id
+
+    def page(self, session_id: str, limit: int = 20, before: int | None = None) -> Dict[str, Any]:
+        rows = self._conn().execute(
+            "SELECT id, timestamp, plugin_name, entity, trigger, fields, logic, related, code "
+            "FROM history WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (session_id, before if before is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+        return _page([self._entry(row) for row in rows], limit)
+
+    def count(self, session_id: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    # ----- Private helper methods -----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _entry(row: tuple) -> Dict[str, Any]:
+        entry = {"id": row[0], **dict(zip(FIELDS, row[1:7]))}
+        entry["related"] = json.loads(row[7]) if row[7] else []
+        entry["code"] = zlib.decompress(row[8]).decode("utf-8") if row[8] else ""
+        return entry
+
+
+def _page(items: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """items holds up to limit + 1 entries, newest first; the extra one only signals a next page."""
+    more = len(items) > limit
+    items = items[:limit]
+    return {"items": items, "next": items[-1]["id"] if more and items else None}
+
+
+def get_history_store(backend: str = HISTORY_BACKEND) -> HistoryStore:
+    if backend == "memory":
+        return MemoryHistoryStore()
+    if backend == "sqlite":
+        return SQLiteHistoryStore()
+    raise ValueError(f"Unknown HISTORY_BACKEND {backend!r} (expected 'sqlite' or 'memory')")
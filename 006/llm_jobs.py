@@ -0,0 +1,222 @@
+"""
+llm_jobs.py
+-----------
+
+Bounded background executor for chat turns that call the LLM, so a Flask
+worker answers in milliseconds instead of holding the request for the whole
+model round trip.
+
+    jobs = JobQueue()
+    job_id = jobs.submit(session_id, run_turn, snapshot)    # returns at once
+    job = jobs.get(job_id, session_id)                      # poll, from any worker
+    job.status()                                            # "queued" | "running" | "done" | "error"
+    job.result()                                            # once done
+    jobs.pop(job_id, session_id)                            # claim it
+
+A turn runs in the process that accepted it, but its state lives in the
+llm_jobs table of a SQLite file (history.db, or $LLM_JOBS_DB), so a poll
+reaching any gunicorn worker sees the same job. Results must be JSON. While
+a job is queued or running, its process refreshes the row's heartbeat every
+HEARTBEAT_SECONDS; a job whose heartbeat is older than LOST_SECONDS (the
+process died or restarted) reads as an error, so the page asks for the
+message again instead of polling forever.
+
+A job submitted with stream=TokenStream() (llm_stream.py) exposes it as
+job.stream – only in the process running it; elsewhere job.stream is None
+and the page falls back to polling. The stream is closed when the job ends,
+however it ends.
+
+At most LLM_WORKERS turns run at a time per process; once LLM_MAX_PENDING
+live jobs are queued or running across all workers, submit() raises
+QueueFull so the route can answer 503 instead of letting the backlog grow.
+Finished jobs nobody claims expire after LLM_JOB_TTL_SECONDS.
+"""
+
+import os, json, time, uuid, sqlite3, threading, traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from llm_stream import TokenStream
+
+LLM_JOBS_PATH = os.getenv("LLM_JOBS_DB", os.getenv("HISTORY_DB", "history.db"))
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+LLM_MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "32"))
+LLM_JOB_TTL_SECONDS = int(os.getenv("LLM_JOB_TTL_SECONDS", "600"))
+HEARTBEAT_SECONDS = 5
+LOST_SECONDS = 30
+LOST_ERROR = "The server restarted while working on this message; please send it again."
+
+# shares the history file, whose schema version history_store owns: create-if-missing only
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_jobs (
+    id        TEXT PRIMARY KEY,
+    owner     TEXT NOT NULL,
+    status    TEXT NOT NULL,
+    result    TEXT,
+    error     TEXT,
+    created   REAL NOT NULL,
+    finished  REAL,
+    heartbeat REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_llm_jobs_status ON llm_jobs (status, heartbeat);
+"""
+
+
+class QueueFull(Exception):
+    """Too many LLM turns queued or running."""
+
+
+class Job:
+    """A job as last read from the table; `stream` only in the process running it."""
+
+    def __init__(self, job_id: str, owner: str, status: str, result: str | None = None,
+                 error: str | None = None, stream: TokenStream | None = None) -> None:
+        self.id = job_id
+        self.owner = owner
+        self.stream = stream
+        self._status = status
+        self._result = result
+        self._error = error or ""
+
+    def status(self) -> str:
+        return self._status
+
+    def result(self) -> Any:
+        return json.loads(self._result) if self._result is not None else None
+
+    def error(self) -> str:
+        return self._error
+
+
+class JobQueue:
+    def __init__(self, path: str = LLM_JOBS_PATH, workers: int = LLM_WORKERS,
+                 max_pending: int = LLM_MAX_PENDING, ttl: int = LLM_JOB_TTL_SECONDS) -> None:
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active: set = set()                              # ids queued or running here
+        self._streams: Dict[str, tuple] = {}                   # id → (stream, created)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="llm-turn")
+        self._heartbeat: threading.Thread | None = None
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    # ----- Public API -----
+    def submit(self, owner: str, fn: Callable, *args, stream: TokenStream | None = None, **kwargs) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._start_heartbeat()
+            conn = self._conn()
+            with conn:
+                self._expire(conn)
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM llm_jobs WHERE status IN ('queued', 'running') AND heartbeat > ?",
+                    (now - LOST_SECONDS,)).fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFull(f"{self.max_pending} LLM turns already pending")
+                conn.execute("INSERT INTO llm_jobs (id, owner, status, created, heartbeat) "
+                             "VALUES (?, ?, 'queued', ?, ?)", (job_id, owner, now, now))
+            self._active.add(job_id)
+            if stream is not None:
+                self._streams[job_id] = (stream, now)
+        self._executor.submit(self._run, job_id, stream, fn, *args, **kwargs)
+        return job_id
+
+    def get(self, job_id: str, owner: str) -> Job | None:
+        """The job, if it exists and was submitted by `owner`."""
+        row = self._conn().execute(
+            "SELECT status, result, error, heartbeat FROM llm_jobs WHERE id = ? AND owner = ?",
+            (job_id, owner)).fetchone()
+        if row is None:
+            return None
+        status, result, error, heartbeat = row
+        if status in ("queued", "running") and heartbeat < time.time() - LOST_SECONDS:
+            status, error = "error", LOST_ERROR
+        stream = self._streams.get(job_id, (None,))[0]
+        return Job(job_id, owner, status, result, error, stream)
+
+    def pop(self, job_id: str, owner: str) -> Job | None:
+        """Claim the job: it is returned by exactly one pop, from any worker."""
+        job = self.get(job_id, owner)
+        if job is None:
+            return None
+        conn = self._conn()
+        with conn:
+            claimed = conn.execute("DELETE FROM llm_jobs WHERE id = ? AND owner = ?",
+                                   (job_id, owner)).rowcount
+        with self._lock:
+            self._streams.pop(job_id, None)
+        return job if claimed else None
+
+    def stats(self) -> Dict[str, int]:
+        counts = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        rows = self._conn().execute(
+            "SELECT CASE WHEN status IN ('queued', 'running') AND heartbeat < ? THEN 'error' "
+            "ELSE status END, COUNT(*) FROM llm_jobs GROUP BY 1", (time.time() - LOST_SECONDS,))
+        counts.update(dict(rows))
+        return {**counts, "workers": self.workers, "max_pending": self.max_pending}
+
+    # ----- Private helper methods -----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def _run(self, job_id: str, stream: TokenStream | None, fn: Callable, *args, **kwargs) -> None:
+        conn = self._conn()
+        try:
+            with conn:
+                conn.execute("UPDATE llm_jobs SET status = 'running', heartbeat = ? WHERE id = ?",
+                             (time.time(), job_id))
+            result = json.dumps(fn(*args, **kwargs))
+            with conn:
+                conn.execute("UPDATE llm_jobs SET status = 'done', result = ?, finished = ? WHERE id = ?",
+                             (result, time.time(), job_id))
+        except Exception as exc:
+            traceback.print_exc()
+            with conn:
+                conn.execute("UPDATE llm_jobs SET status = 'error', error = ?, finished = ? WHERE id = ?",
+                             (str(exc), time.time(), job_id))
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+            if stream is not None:
+                stream.close()
+
+    def _start_heartbeat(self) -> None:
+        # started on first submit, so a gunicorn worker forked after import gets its own
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="llm-jobs-heartbeat",
+                                               daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                with self._lock:
+                    active = list(self._active)
+                conn = self._conn()
+                with conn:
+                    conn.executemany("UPDATE llm_jobs SET heartbeat = ? WHERE id = ?",
+                                     [(time.time(), job_id) for job_id in active])
+                with self._lock, conn:
+                    self._expire(conn)
+            except Exception:
+                traceback.print_exc()
+
+    def _expire(self, conn: sqlite3.Connection) -> None:
+        """Drop finished jobs nobody claimed and lost ones, once older than the TTL."""
+        cutoff = time.time() - self.ttl
+        conn.execute("DELETE FROM llm_jobs WHERE finished < ? OR (finished IS NULL AND heartbeat < ?)",
+                     (cutoff, cutoff))
+        for job_id in [i for i, (_, created) in self._streams.items()
+                       if created < cutoff and i not in self._active]:
+            del self._streams[job_id]
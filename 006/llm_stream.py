@@ -0,0 +1,98 @@
+"""
+llm_stream.py
+-------------
+
+Token streaming for code generation. autogen prints a streamed completion
+(llm_config "stream": True) chunk by chunk to its default IOStream; while
+`capture(stream)` is active in the generating thread that IOStream is a
+TokenStream, which buffers the chunks for any number of readers – the
+/jobs/<id>/stream SSE endpoint in app.py.
+
+    stream = TokenStream()
+    with capture(stream):                       # in the llm_jobs worker
+        code = code_agent.generate_reply(messages)
+    stream.close()
+
+    for index, text in stream.read(start=0):    # in the request thread
+        ...                                     # ends once the stream is closed
+
+Without autogen.io (older autogen) nothing is captured; callers still close
+the stream, so readers just see it end and fall back to the final reply.
+"""
+
+import re, threading
+from contextlib import nullcontext
+from typing import Any, Iterator, List, Tuple
+
+try:
+    from autogen.io import IOStream
+except ImportError:         # autogen without pluggable output
+    IOStream = None
+
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")      # colour codes autogen prints around a stream
+READ_TIMEOUT_SECONDS = 15                   # idle wait before read() yields a keep-alive
+
+
+class TokenStream:
+    """Append-only buffer of streamed text chunks; an autogen IOStream."""
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.closed = False
+        self._cond = threading.Condition()
+
+    # ----- IOStream protocol -----
+    def print(self, *objects: Any, sep: str = " ", end: str = "\n", flush: bool = False) -> None:
+        self.write(sep.join(map(str, objects)) + end)
+
+    def send(self, message: Any) -> None:
+        # newer autogen sends StreamEvent/StreamMessage objects instead of printing
+        if type(message).__name__.startswith("Stream"):
+            self.write(str(getattr(message, "content", "") or ""))
+
+    def input(self, prompt: str = "", *, password: bool = False) -> str:
+        return ""
+
+    # ----- Public API -----
+    def write(self, text: str) -> None:
+        text = _ANSI.sub("", text)
+        if not text:
+            return
+        with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def read(self, start: int = 0, timeout: float = READ_TIMEOUT_SECONDS) -> Iterator[Tuple[int, str | None]]:
+        """
+        Yield (index, chunk) from chunk `start` on until the stream is closed;
+        (index, None) after `timeout` seconds without new text.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self.chunks) and not self.closed:
+                    self._cond.wait(timeout)
+                new = self.chunks[index:]
+                closed = self.closed
+            for chunk in new:
+                yield index, chunk
+                index += 1
+            if not new:
+                if closed:
+                    return
+                yield index, None
+
+
+def capture(stream: TokenStream | None):
+    """Route autogen's streamed output in this thread into `stream` (no-op without one)."""
+    if stream is None or IOStream is None:
+        return nullcontext()
+    return IOStream.set_default(stream)
@@ -0,0 +1,212 @@
+"""
+metadata_catalog.py
+-------------------
+
+In-memory metadata catalog for the chat app.
+
+- load():   reads entity_map.json and every harvested table's fields once,
+            plus environment_entity_map.json – names of every table in the
+            org, whose columns are only fetched the first time one is used;
+            entity_recognizer is recompiled whenever entity_map changes
+- start():  loads, then refreshes in a background thread every
+            METADATA_REFRESH_SECONDS (incremental sync_metadata run + reload);
+            with several workers only the one holding metadata_refresh.lock
+            syncs, the others just reload. Files are replaced atomically
+            (file_cache.write_json), so readers never see half-written JSON
+- field_map(entity):  (field_map, fields_dict) when the table is loaded;
+            None while its metadata is being fetched on demand in the
+            background, so the chat request never waits on Dataverse
+- relationship_graph():  lookup graph of the loaded tables, built once per
+            change of the loaded tables
+
+Usage (app.py):
+    catalog = MetadataCatalog()
+    catalog.start()
+    reqs = extract_requirements(conversation, requirements_agent, catalog=catalog)
+"""
+
+import os, time, threading, traceback, contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple
+
+from crm_metadata_client import CrmMetadataClient
+from fetch_entities import fetch_environment_entities, build_entity_map, ENVIRONMENT_MAP_PATH
+from entity_recognizer import EntityRecognizer
+from fetch_fields import harvest
+from file_cache import write_json
+from metadata_store import MetadataStore
+from relationship_graph import RelationshipGraph
+from sync_metadata import sync, load_state
+from utils import load_entity_map, load_field_map
+
+REFRESH_SECONDS = int(os.getenv("METADATA_REFRESH_SECONDS", "3600"))   # 0 disables
+RETRY_FAILED_SECONDS = 300          # wait before fetching a failed table again
+REFRESH_LOCK_PATH = "metadata_refresh.lock"
+
+try:
+    import fcntl
+except ImportError:         # Windows: no cross-process lock, every process syncs
+    fcntl = None
+
+
+class MetadataCatalog:
+    def __init__(self, refresh_seconds: int = REFRESH_SECONDS) -> None:
+        self.refresh_seconds = refresh_seconds
+        self.entity_map: Dict[str, str] = {}
+        self.entity_recognizer = EntityRecognizer({})  # compiled from entity_map on every swap
+        self._fields: Dict[str, Tuple[dict, dict]] = {}
+        self._pending: Dict[str, object] = {}        # entity → Future
+        self._failed: Dict[str, float] = {}          # entity → time of failure
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="metadata-fetch")
+        self._client = None
+        self._store = None
+        self._graph: RelationshipGraph | None = None  # rebuilt lazily when _fields changes
+
+    # ----- Public API -----
+    def start(self) -> "MetadataCatalog":
+        self.load()
+        if not os.path.exists(ENVIRONMENT_MAP_PATH):
+            self._executor.submit(self._fetch_environment)
+        if self.refresh_seconds > 0:
+            threading.Thread(target=self._refresh_loop, name="metadata-refresh", daemon=True).start()
+        return self
+
+    def load(self) -> None:
+        """(Re)load entity maps and the solution's harvested tables from disk."""
+        solution_map = load_entity_map()
+        fields = {}
+        for logical in set(solution_map.values()):
+            field_map, fields_dict = load_field_map(logical)
+            if fields_dict:
+                fields[logical] = (field_map, fields_dict)
+        # solution names first so they win over org-wide tables with similar names
+        entity_map = dict(solution_map)
+        for name, logical in load_entity_map(ENVIRONMENT_MAP_PATH).items():
+            entity_map.setdefault(name, logical)
+        recognizer = EntityRecognizer(entity_map)
+        with self._lock:
+            self.entity_map = entity_map
+            self.entity_recognizer = recognizer
+            # keep tables fetched lazily since the last load
+            self._fields = {**self._fields, **fields}
+            self._graph = None
+        print(f"Metadata catalog: {len(set(entity_map.values()))} tables known, "
+              f"{len(self._fields)} loaded.")
+
+    def field_map(self, entity: str) -> Tuple[dict, dict] | None:
+        """Loaded (field_map, fields_dict), or None while the table is being fetched."""
+        loaded = self._fields.get(entity)
+        if loaded is not None:
+            return loaded
+        # harvested by hand since the last load?
+        field_map, fields_dict = load_field_map(entity)
+        if fields_dict:
+            with self._lock:
+                self._fields[entity] = (field_map, fields_dict)
+                self._graph = None
+            return field_map, fields_dict
+        if time.time() - self._failed.get(entity, 0) < RETRY_FAILED_SECONDS:
+            return {}, {}
+        self.fetch_async(entity)
+        return None
+
+    def status(self, entity: str) -> str:
+        if entity in self._fields:
+            return "ready"
+        if entity in self._pending:
+            return "fetching"
+        if entity in self._failed:
+            return "failed"
+        return "unknown"
+
+    def relationship_graph(self) -> RelationshipGraph:
+        with self._lock:
+            if self._graph is None:
+                self._graph = RelationshipGraph({e: fd for e, (_, fd) in self._fields.items()})
+            return self._graph
+
+    def fetch_async(self, entity: str) -> None:
+        with self._lock:
+            if entity in self._pending:
+                return
+            self._pending[entity] = self._executor.submit(self._fetch, entity)
+
+    def refresh(self) -> None:
+        """Incremental sync of every known table, then reload from disk."""
+        with _refresh_lock() as holder:
+            if holder:
+                try:
+                    sync(self._metadata_client(), sorted(self._fields), load_state(),
+                         store=self._metadata_store())
+                except Exception as exc:
+                    print(f"Metadata refresh failed: {exc}")
+        self.load()
+
+    # ----- Private helper methods -----
+    def _metadata_client(self) -> CrmMetadataClient:
+        if self._client is None:
+            self._client = CrmMetadataClient()
+        return self._client
+
+    def _metadata_store(self) -> MetadataStore:
+        if self._store is None:
+            self._store = MetadataStore()
+        return self._store
+
+    def _fetch(self, entity: str) -> None:
+        try:
+            result = harvest(self._metadata_client(), [entity], workers=1,
+                             store=self._metadata_store())
+            if entity in result["failed"]:
+                raise RuntimeError(result["failed"][entity])
+            field_map, fields_dict = load_field_map(entity)
+            with self._lock:
+                self._fields[entity] = (field_map, fields_dict)
+                self._graph = None
+                self._failed.pop(entity, None)
+        except Exception as exc:
+            print(f"On-demand metadata fetch failed [{entity}]: {exc}")
+            traceback.print_exc()
+            self._failed[entity] = time.time()
+        finally:
+            with self._lock:
+                self._pending.pop(entity, None)
+
+    def _fetch_environment(self) -> None:
+        """One EntityDefinitions query for the org-wide name catalog."""
+        try:
+            entity_map = build_entity_map(fetch_environment_entities())
+            write_json(ENVIRONMENT_MAP_PATH, entity_map)
+            with self._lock:
+                # swap in a new dict: requests iterate the current one without locking
+                merged = dict(self.entity_map)
+                for name, logical in entity_map.items():
+                    merged.setdefault(name, logical)
+                self.entity_map = merged
+                self.entity_recognizer = EntityRecognizer(merged)
+        except Exception as exc:
+            print(f"Environment table catalog fetch failed: {exc}")
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(self.refresh_seconds)
+            self.refresh()
+
+
+@contextlib.contextmanager
+def _refresh_lock():
+    """True while this process holds the refresh lock; False if another worker does."""
+    if fcntl is None:
+        yield True
+        return
+    with open(REFRESH_LOCK_PATH, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
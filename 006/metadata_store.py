@@ -0,0 +1,291 @@
+"""
+metadata_store.py
+-----------------
+
+Single-file SQLite store for harvested column metadata, replacing one
+`fields/<logical>_fields.json` per table.
+
+    store = MetadataStore()                       # metadata.db (or $METADATA_DB)
+    store.get_fields("account")                   # same dict as account_fields.json
+    store.field_by_label("account", "Main Phone") # → "telephone1"
+    store.get_optionset("account", "statuscode")  # → [{value, label}, ...]
+    store.get_lookup_targets("account", "parentaccountid")
+
+Global choices are stored once in `global_options`; columns that use one
+only record its name and get_fields() resolves it.
+
+Readers open the file read-only with one connection per thread, so several
+Flask workers can share it without parsing JSON.  fetch_fields.py writes to
+it; `export_json` reproduces the fields/*.json layout.
+
+CLI:
+    python metadata_store.py --import   # load existing fields/*.json
+    python metadata_store.py --export   # write fields/*.json from the store
+"""
+
+import os, json, glob, sqlite3, threading, argparse
+from typing import Dict, Any, List
+
+STORE_PATH = os.getenv("METADATA_DB", "metadata.db")
+GLOBAL_OPTIONSETS_FILE = "global_optionsets.json"     # inside the fields/ folder
+SCHEMA_VERSION = 3                                     # bump to rebuild old stores
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fields (
+    entity       TEXT NOT NULL,
+    logical      TEXT NOT NULL,
+    pos          INTEGER NOT NULL,
+    logical_name TEXT NOT NULL,
+    display      TEXT NOT NULL,
+    type         TEXT NOT NULL,
+    global_optionset TEXT,
+    PRIMARY KEY (entity, logical)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS labels (
+    entity  TEXT NOT NULL,
+    label   TEXT NOT NULL,
+    logical TEXT NOT NULL,
+    PRIMARY KEY (entity, label)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS options (
+    entity  TEXT NOT NULL,
+    logical TEXT NOT NULL,
+    pos     INTEGER NOT NULL,
+    value   INTEGER NOT NULL,
+    label   TEXT NOT NULL,
+    localized TEXT,                 -- JSON {lcid: label}, multi-language orgs only
+    PRIMARY KEY (entity, logical, pos)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS targets (
+    entity  TEXT NOT NULL,
+    logical TEXT NOT NULL,
+    pos     INTEGER NOT NULL,
+    target  TEXT NOT NULL,
+    PRIMARY KEY (entity, logical, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_targets_target ON targets (target);
+CREATE TABLE IF NOT EXISTS global_options (
+    name    TEXT NOT NULL,
+    pos     INTEGER NOT NULL,
+    value   INTEGER NOT NULL,
+    label   TEXT NOT NULL,
+    localized TEXT,
+    PRIMARY KEY (name, pos)
+) WITHOUT ROWID;
+"""
+
+
+class MetadataStore:
+    def __init__(self, path: str = STORE_PATH, readonly: bool = False) -> None:
+        self.path = path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        if not readonly:
+            conn = self._conn()
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # derived data only – drop and let the next harvest/import refill it
+                for (table,) in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    conn.execute(f"DROP TABLE {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(SCHEMA)
+
+    # ----- Read API -----
+    def entities(self) -> List[str]:
+        rows = self._conn().execute("SELECT DISTINCT entity FROM fields ORDER BY entity")
+        return [r[0] for r in rows]
+
+    def has_entity(self, entity: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM fields WHERE entity = ? LIMIT 1", (entity,)).fetchone()
+        return row is not None
+
+    def get_fields(self, entity: str, resolve: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+        { logical_lower: {logicalName, displayName, type, targets, optionset} }
+
+        Columns on a global choice carry "globalOptionSet": name; resolve=True
+        also fills their optionset (one list shared by all columns of that set).
+        """
+        conn = self._conn()
+        out, global_sets = {}, {}
+        for logical, logical_name, display, typ, global_name in conn.execute(
+                "SELECT logical, logical_name, display, type, global_optionset "
+                "FROM fields WHERE entity = ? ORDER BY pos", (entity,)):
+            out[logical] = {"logicalName": logical_name, "displayName": display,
+                            "type": typ, "targets": [], "optionset": []}
+            if global_name:
+                out[logical]["globalOptionSet"] = global_name
+                if resolve:
+                    if global_name not in global_sets:
+                        global_sets[global_name] = self._global_options(global_name)
+                    out[logical]["optionset"] = global_sets[global_name]
+        for logical, target in conn.execute(
+                "SELECT logical, target FROM targets WHERE entity = ? ORDER BY logical, pos",
+                (entity,)):
+            out[logical]["targets"].append(target)
+        for logical, value, label, localized in conn.execute(
+                "SELECT logical, value, label, localized FROM options WHERE entity = ? "
+                "ORDER BY logical, pos", (entity,)):
+            out[logical]["optionset"].append(self._option(value, label, localized))
+        return out
+
+    def field_by_label(self, entity: str, label: str) -> str | None:
+        """Logical name for a display or logical name (case-insensitive)."""
+        row = self._conn().execute(
+            "SELECT logical FROM labels WHERE entity = ? AND label = ?",
+            (entity, label.strip().lower())).fetchone()
+        return row[0] if row else None
+
+    def get_optionset(self, entity: str, field: str) -> List[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT global_optionset FROM fields WHERE entity = ? AND logical = ?",
+            (entity, field.lower())).fetchone()
+        if row and row[0]:
+            return self._global_options(row[0])
+        rows = conn.execute(
+            "SELECT value, label, localized FROM options WHERE entity = ? AND logical = ? ORDER BY pos",
+            (entity, field.lower()))
+        return [self._option(*row) for row in rows]
+
+    def get_global_optionsets(self) -> Dict[str, List[Dict[str, Any]]]:
+        out = {}
+        for name, value, label, localized in self._conn().execute(
+                "SELECT name, value, label, localized FROM global_options ORDER BY name, pos"):
+            out.setdefault(name, []).append(self._option(value, label, localized))
+        return out
+
+    def get_lookup_targets(self, entity: str, field: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT target FROM targets WHERE entity = ? AND logical = ? ORDER BY pos",
+            (entity, field.lower()))
+        return [r[0] for r in rows]
+
+    # ----- Write API -----
+    def write_entity(self, entity: str, attrs: List[Dict[str, Any]]) -> None:
+        """Replace every column of *entity* with *attrs* (get_attributes output)."""
+        field_rows, label_rows, option_rows, target_rows = [], {}, [], []
+        for pos, f in enumerate(attrs):
+            logical = f["logicalName"].lower()
+            display = f.get("displayName") or ""
+            field_rows.append((entity, logical, pos, f["logicalName"], display,
+                               f.get("type", "Unknown"), f.get("globalOptionSet")))
+            # same precedence as utils.load_field_map: later entries overwrite earlier ones
+            label_rows[logical] = logical
+            if display:
+                label_rows[display.lower()] = logical
+            option_rows += [(entity, logical, i, o["value"], o["label"], self._localized(o))
+                            for i, o in enumerate(f.get("optionset") or [])]
+            target_rows += [(entity, logical, i, t) for i, t in enumerate(f.get("targets") or [])]
+
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._delete(conn, entity)
+                conn.executemany("INSERT INTO fields VALUES (?, ?, ?, ?, ?, ?, ?)", field_rows)
+                conn.executemany("INSERT INTO labels VALUES (?, ?, ?)",
+                                 [(entity, label, logical) for label, logical in label_rows.items()])
+                conn.executemany("INSERT INTO options VALUES (?, ?, ?, ?, ?, ?)", option_rows)
+                conn.executemany("INSERT INTO targets VALUES (?, ?, ?, ?)", target_rows)
+
+    def write_global_optionsets(self, optionsets: Dict[str, List[Dict[str, Any]]]) -> None:
+        rows = [(name, i, o["value"], o["label"], self._localized(o))
+                for name, opts in optionsets.items() for i, o in enumerate(opts)]
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.executemany("DELETE FROM global_options WHERE name = ?",
+                                 [(name,) for name in optionsets])
+                conn.executemany("INSERT INTO global_options VALUES (?, ?, ?, ?, ?)", rows)
+
+    def delete_entity(self, entity: str) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._delete(conn, entity)
+
+    def import_json(self, folder: str = "fields") -> int:
+        count = 0
+        global_path = os.path.join(folder, GLOBAL_OPTIONSETS_FILE)
+        if os.path.isfile(global_path):
+            with open(global_path, "r", encoding="utf-8") as f:
+                self.write_global_optionsets(json.load(f))
+        for path in glob.glob(os.path.join(folder, "*_fields.json")):
+            entity = os.path.basename(path)[:-len("_fields.json")]
+            with open(path, "r", encoding="utf-8") as f:
+                self.write_entity(entity, list(json.load(f).values()))
+            count += 1
+        return count
+
+    def export_json(self, folder: str = "fields") -> int:
+        os.makedirs(folder, exist_ok=True)
+        entities = self.entities()
+        for entity in entities:
+            with open(os.path.join(folder, f"{entity}_fields.json"), "w", encoding="utf-8") as f:
+                json.dump(self.get_fields(entity, resolve=False), f, indent=2)
+        with open(os.path.join(folder, GLOBAL_OPTIONSETS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.get_global_optionsets(), f, indent=2)
+        return len(entities)
+
+    # ----- Private helper methods -----
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.readonly:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            else:
+                conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _global_options(self, name: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT value, label, localized FROM global_options WHERE name = ? ORDER BY pos", (name,))
+        return [self._option(*row) for row in rows]
+
+    @staticmethod
+    def _option(value: int, label: str, localized: str | None) -> Dict[str, Any]:
+        opt = {"value": value, "label": label}
+        if localized:
+            opt["localizedLabels"] = json.loads(localized)
+        return opt
+
+    @staticmethod
+    def _localized(opt: Dict[str, Any]) -> str | None:
+        return json.dumps(opt["localizedLabels"]) if opt.get("localizedLabels") else None
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, entity: str) -> None:
+        for table in ("fields", "labels", "options", "targets"):
+            conn.execute(f"DELETE FROM {table} WHERE entity = ?", (entity,))
+
+
+_readers: Dict[str, MetadataStore] = {}
+
+
+def get_store(path: str = STORE_PATH) -> MetadataStore | None:
+    """Shared read-only store, or None when nothing has been harvested into it yet."""
+    if path not in _readers:
+        if not os.path.isfile(path):
+            return None
+        _readers[path] = MetadataStore(path, readonly=True)
+    return _readers[path]
+
+
+# ----- CLI -----
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the metadata store.")
+    parser.add_argument("--import", dest="do_import", action="store_true",
+                        help="load fields/*.json into the store")
+    parser.add_argument("--export", action="store_true",
+                        help="write fields/*.json from the store")
+    args = parser.parse_args()
+
+    store = MetadataStore()
+    if args.do_import:
+        print(f"Imported {store.import_json()} tables into {store.path}")
+    if args.export:
+        print(f"Exported {store.export_json()} tables to fields/")
@@ -0,0 +1,60 @@
+"""
+option_index.py
+---------------
+
+Constant-time option set lookups for utils.get_optionset_value and friends.
+
+OptionIndex maps label → value and value → label for one option set.
+Labels are matched case-insensitively, with surrounding and repeated
+whitespace ignored. Localized labels (the "localizedLabels" {lcid: label} that
+crm_metadata_client harvests in multi-language orgs) resolve as well.
+
+FieldsDict is the fields_dict returned by utils.load_fields_dict; it indexes
+every column's option set when the metadata loads. Columns sharing one global
+option set list share one index. Treat a FieldsDict as read-only once loaded.
+"""
+
+from typing import Any, Dict, List
+
+
+def label_key(label: str) -> str:
+    return " ".join(str(label).split()).casefold()
+
+
+class OptionIndex:
+    def __init__(self, optionset: List[Dict[str, Any]]) -> None:
+        self.by_label: Dict[str, int] = {}
+        self.by_value: Dict[int, str] = {}
+        self.localized: Dict[int, Dict[str, str]] = {}
+        for opt in optionset:
+            # first option wins on duplicate labels, like the original linear scan
+            self.by_label.setdefault(label_key(opt["label"]), opt["value"])
+            self.by_value.setdefault(opt["value"], opt["label"])
+            for lcid, text in (opt.get("localizedLabels") or {}).items():
+                self.by_label.setdefault(label_key(text), opt["value"])
+                self.localized.setdefault(opt["value"], {})[str(lcid)] = text
+
+    def value(self, label: str) -> int | None:
+        return self.by_label.get(label_key(label))
+
+    def label(self, value: int, lcid: int | str | None = None) -> str | None:
+        if lcid is not None:
+            text = self.localized.get(value, {}).get(str(lcid))
+            if text is not None:
+                return text
+        return self.by_value.get(value)
+
+
+class FieldsDict(dict):
+    """{logical_lower: info} with an OptionIndex per column that has an option set."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        shared: Dict[int, OptionIndex] = {}
+        self.option_indexes: Dict[str, OptionIndex] = {}
+        for field, info in self.items():
+            optionset = info.get("optionset")
+            if optionset:
+                if id(optionset) not in shared:
+                    shared[id(optionset)] = OptionIndex(optionset)
+                self.option_indexes[field] = shared[id(optionset)]
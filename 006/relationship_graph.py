@@ -0,0 +1,94 @@
+"""
+relationship_graph.py
+---------------------
+
+In-memory lookup graph built from the harvested "targets" of every loaded
+table, for requirements that follow lookups across tables
+("copy the primary contact's email onto the account").
+
+    graph = RelationshipGraph({"account": account_fields, "contact": contact_fields})
+    graph.targets("account", "primarycontactid")       # → ["contact"]
+    graph.path("account", "contact")                    # → [Hop("account", "primarycontactid", "contact")]
+    format_path(graph.path("account", "contact"), "emailaddress1")
+    # → "account.primarycontactid → contact.emailaddress1"
+
+Adjacency lists are indexed by table and by (table, column); paths follow
+lookups in their N:1 direction (one related record per hop), are found
+breadth-first and memoized, so repeated queries are dictionary lookups.
+Audit/ownership lookups (createdby, ownerid, ...) are left out of path
+search: they connect every table through systemuser and are never what a
+business rule means by a related record.
+"""
+
+from collections import deque
+from typing import Dict, List, NamedTuple
+
+SYSTEM_LOOKUPS = {"createdby", "createdonbehalfby", "modifiedby", "modifiedonbehalfby",
+                  "createdbyexternalparty", "modifiedbyexternalparty", "ownerid", "owninguser",
+                  "owningteam", "owningbusinessunit", "transactioncurrencyid"}
+MAX_HOPS = 3
+
+
+class Hop(NamedTuple):
+    table: str
+    column: str
+    target: str
+
+
+def format_path(hops: List[Hop], field: str) -> str:
+    """'a.lookup → b.lookup → c.field' for a path ending on `field` of the last table."""
+    parts = [f"{h.table}.{h.column}" for h in hops]
+    return " → ".join(parts + [f"{hops[-1].target}.{field}" if hops else field])
+
+
+class RelationshipGraph:
+    def __init__(self, tables: Dict[str, Dict[str, dict]]) -> None:
+        self.lookups: Dict[tuple, List[str]] = {}           # (table, column) → target tables
+        self.edges: Dict[str, List[Hop]] = {}               # table → outgoing lookups
+        self.referenced_by: Dict[str, List[Hop]] = {}       # table → lookups pointing at it
+        for table, fields_dict in tables.items():
+            for column, info in fields_dict.items():
+                targets = info.get("targets") or []
+                if not targets:
+                    continue
+                self.lookups[(table, column)] = list(targets)
+                for target in targets:
+                    hop = Hop(table, column, target)
+                    self.referenced_by.setdefault(target, []).append(hop)
+                    if column not in SYSTEM_LOOKUPS:
+                        self.edges.setdefault(table, []).append(hop)
+        self._paths: Dict[tuple, List[Hop] | None] = {}
+
+    def targets(self, table: str, column: str) -> List[str]:
+        return self.lookups.get((table, column.lower()), [])
+
+    def path(self, source: str, target: str, max_hops: int = MAX_HOPS) -> List[Hop] | None:
+        """Shortest lookup path from source to target (first lookup in column order wins)."""
+        key = (source, target, max_hops)
+        if key not in self._paths:
+            self._paths[key] = self._search(source, target, max_hops)
+        return self._paths[key]
+
+    # ----- Private helper methods -----
+    def _search(self, source: str, target: str, max_hops: int) -> List[Hop] | None:
+        if source == target:
+            return []
+        came_from: Dict[str, Hop] = {}
+        queue = deque([(source, 0)])
+        seen = {source}
+        while queue:
+            table, depth = queue.popleft()
+            if depth == max_hops:
+                continue
+            for hop in self.edges.get(table, []):
+                if hop.target in seen:
+                    continue
+                seen.add(hop.target)
+                came_from[hop.target] = hop
+                if hop.target == target:
+                    path = [hop]
+                    while path[0].table != source:
+                        path.insert(0, came_from[path[0].table])
+                    return path
+                queue.append((hop.target, depth + 1))
+        return None
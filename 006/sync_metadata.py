@@ -0,0 +1,151 @@
+"""
+sync_metadata.py  –  Incremental refresh of fields/<logical>_fields.json
+-----------------------------------------------------------------------
+
+Uses Dataverse RetrieveMetadataChanges with a stored ClientVersionStamp so a
+re-run only downloads tables and columns changed since the last sync.
+
+• Reads `solution_entities.json`   (output of fetch_entities.py)
+• Keeps per-table stamps and MetadataIds in `metadata_sync.json`
+• Rewrites only the field files (and metadata store rows) that changed;
+  deleted columns are removed and a deleted table's field file is dropped
+• Global choices stay globalOptionSet references, as fetch_fields writes
+  them; their options go to fields/global_optionsets.json
+• Tables seen for the first time, or whose stamp has expired on the server,
+  fall back to a full fetch
+
+Run:
+    python sync_metadata.py           # incremental
+    python sync_metadata.py --full    # ignore stored stamps
+"""
+
+import os, json, argparse
+from collections import defaultdict
+from crm_metadata_client import CrmMetadataClient, VersionStampExpired
+from fetch_fields import load_solution_entities, save_field_file, write_global_optionsets
+from file_cache import write_json
+from metadata_store import MetadataStore
+
+STATE_PATH = "metadata_sync.json"
+CHUNK_SIZE = 25          # tables per RetrieveMetadataChanges call (URL length)
+
+
+# ----------------------------------------------------------------- state
+def load_state(path: str = STATE_PATH) -> dict:
+    if not os.path.isfile(path):
+        return {"tables": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError as exc:
+        # unreadable stamps only cost a full sync
+        print(f"   {path} unreadable ({exc}) – full sync")
+        return {"tables": {}}
+
+
+def save_state(state: dict, path: str = STATE_PATH):
+    write_json(path, state)
+
+
+def load_field_file(logical: str) -> dict:
+    path = f"fields/{logical}_fields.json"
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ----------------------------------------------------------------- sync
+def _apply(logical: str, result: dict, table_state: dict, full: bool,
+           store: MetadataStore | None = None) -> str:
+    """Merge one table's changes into its field file; returns a status word."""
+    changed = result["tables"].get(logical)
+    deleted = result["deleted"]
+
+    if table_state.get("metadataId") in deleted:
+        path = f"fields/{logical}_fields.json"
+        if os.path.isfile(path):
+            os.remove(path)
+        if store is not None:
+            store.delete_entity(logical)
+        return "deleted"
+
+    if full:
+        if changed is None:
+            return "missing"
+        fields, attr_ids = {}, {}
+    else:
+        fields = load_field_file(logical)
+        attr_ids = dict(table_state.get("attributes", {}))
+
+    dirty = full
+    for mid in deleted & attr_ids.keys():
+        fields.pop(attr_ids.pop(mid).lower(), None)
+        dirty = True
+
+    for col in (changed or {}).get("columns", []):
+        mid = col.pop("metadataId", None)
+        if mid:
+            attr_ids[mid] = col["logicalName"]
+        fields[col["logicalName"].lower()] = col
+        dirty = True
+
+    if changed is not None:
+        table_state["metadataId"] = changed["metadataId"] or table_state.get("metadataId")
+    table_state["attributes"] = attr_ids
+    table_state["stamp"] = result["stamp"]
+
+    if not dirty:
+        return "unchanged"
+    save_field_file(logical, list(fields.values()), store)
+    return "full" if full else "updated"
+
+
+def sync(client: CrmMetadataClient, logicals: list[str], state: dict, full: bool = False,
+         store: MetadataStore | None = None) -> dict:
+    tables_state = state.setdefault("tables", {})
+
+    # tables sharing a stamp can be asked for in one call
+    groups = defaultdict(list)
+    for logical in logicals:
+        stamp = None if full else tables_state.get(logical, {}).get("stamp")
+        groups[stamp].append(logical)
+
+    summary = defaultdict(list)
+    for stamp, names in groups.items():
+        for i in range(0, len(names), CHUNK_SIZE):
+            chunk = names[i:i + CHUNK_SIZE]
+            try:
+                result = client.get_metadata_changes(chunk, stamp, global_refs=True)
+                is_full = stamp is None
+            except VersionStampExpired:
+                print(f"   stamp expired for {len(chunk)} tables – full refresh")
+                result = client.get_metadata_changes(chunk, global_refs=True)
+                is_full = True
+            if result["optionsets"]:
+                write_global_optionsets(result["optionsets"], store)
+
+            for logical in chunk:
+                table_state = tables_state.setdefault(logical, {})
+                status = _apply(logical, result, table_state, is_full, store)
+                if status == "deleted":
+                    tables_state.pop(logical, None)
+                summary[status].append(logical)
+                if status != "unchanged":
+                    print(f"   {status:<9} {logical}")
+
+    save_state(state)
+    return dict(summary)
+
+
+# ----------------------------------------------------------------- main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental metadata sync.")
+    parser.add_argument("--full", action="store_true", help="ignore stored version stamps")
+    args = parser.parse_args()
+
+    client = CrmMetadataClient()
+    entities = load_solution_entities()
+    summary = sync(client, [logical for logical, _ in entities.values()], load_state(), args.full,
+                   MetadataStore())
+    print("Sync done – " + ", ".join(f"{len(v)} {k}" for k, v in summary.items()))
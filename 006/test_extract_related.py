@@ -0,0 +1,53 @@
+"""
+Related fields (utils.extract_related) on the harvested tables in fields/.
+
+    python test_extract_related.py        # or: python -m pytest test_extract_related.py
+"""
+
+import os, contextlib
+
+from utils import extract_fields_from_text, extract_related, extract_requirements, load_field_map
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@contextlib.contextmanager
+def _in_app_folder():
+    cwd = os.getcwd()
+    os.chdir(HERE)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def _related(entity: str, text: str) -> list:
+    field_map, _ = load_field_map(entity)
+    return extract_related(entity, text, extract_fields_from_text(field_map, text))
+
+
+def test_table_name_is_no_related_field():
+    # "event" inside "event config" names the lookup's target table, not a field on it
+    with _in_app_folder():
+        text = "when an event config is created set its name"
+        assert _related("pshb_eventconfig", text) == []
+        assert extract_requirements([{"role": "user", "content": text}])["related"] == []
+
+
+def test_trigger_table_is_no_related_table():
+    # the event the trigger fires on, not the event config's lookup
+    with _in_app_folder():
+        assert _related("pshb_eventconfig", "on event update set the description") == []
+
+
+def test_related_field_through_lookup():
+    with _in_app_folder():
+        assert _related("pshb_eventconfig", "when an event config is created copy the event description") == \
+            ["pshb_eventconfig.pshb_event → msevtmgt_event.msevtmgt_description"]
+
+
+if __name__ == "__main__":
+    test_table_name_is_no_related_field()
+    test_trigger_table_is_no_related_table()
+    test_related_field_through_lookup()
+    print("ok")
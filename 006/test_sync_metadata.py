@@ -0,0 +1,89 @@
+"""
+Sync against the Dataverse stand-in must keep global choices as references.
+
+    python test_sync_metadata.py        # or: python -m pytest test_sync_metadata.py
+"""
+
+import os, json, tempfile, contextlib, io, pathlib
+
+import token_broker
+import fake_dataverse
+from crm_metadata_client import CrmMetadataClient
+from fetch_fields import harvest
+from metadata_store import MetadataStore
+from sync_metadata import sync
+
+# the stand-in's tables, as harvested field files (fake_dataverse.fixture_from_fields)
+FIELDS = {"new_order": {
+    "new_orderid": {"logicalName": "new_orderid", "displayName": "Order", "type": "Uniqueidentifier"},
+    "new_name": {"logicalName": "new_name", "displayName": "Name", "type": "String"},
+    "new_priority": {"logicalName": "new_priority", "displayName": "Priority", "type": "Picklist",
+                     "optionset": [{"value": 1, "label": "Low"}, {"value": 2, "label": "High"}]},
+    "new_region": {"logicalName": "new_region", "displayName": "Region", "type": "Picklist",
+                   "globalOptionSet": "new_region"},
+}}
+REGIONS = [{"value": 100000000, "label": "North"}, {"value": 100000001, "label": "South"}]
+
+
+def _fixture(folder: pathlib.Path, regions: list) -> dict:
+    folder.mkdir(exist_ok=True)
+    for logical, fields in FIELDS.items():
+        (folder / f"{logical}_fields.json").write_text(json.dumps(fields), encoding="utf-8")
+    (folder / "global_optionsets.json").write_text(json.dumps({"new_region": regions}), encoding="utf-8")
+    return fake_dataverse.fixture_from_fields(str(folder), solution="Test")
+
+
+def _client(url: str) -> CrmMetadataClient:
+    with open("crm_config.json", "w", encoding="utf-8") as f:
+        json.dump({"tenant_id": "test", "client_id": "test", "client_secret": "test",
+                   "resource": url}, f)
+    token_broker._broker = token_broker.TokenBroker(
+        background_refresh=False, authority_host=url, app_factory=fake_dataverse.StandInTokenApp)
+    return CrmMetadataClient("crm_config.json")
+
+
+def _fields() -> dict:
+    with open("fields/new_order_fields.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_sync_keeps_global_choice_refs(tmp_path):
+    srv = fake_dataverse.serve(_fixture(tmp_path / "recorded", REGIONS))
+    cwd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        client, store = _client(srv.url), MetadataStore("metadata.db")
+        with contextlib.redirect_stdout(io.StringIO()):
+            harvest(client, ["new_order"], store=store)
+        harvested = _fields()
+        assert harvested["new_region"]["globalOptionSet"] == "new_region"
+        assert not harvested["new_region"]["optionset"]
+
+        state = {"tables": {}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            # first sync is a full fetch that rewrites the harvested file
+            assert sync(client, ["new_order"], state, store=store) == {"full": ["new_order"]}
+            assert _fields() == harvested
+
+            # incremental sync touching the global-choice column
+            regions = REGIONS + [{"value": 100000002, "label": "West"}]
+            srv.fixture["global_optionsets"] = _fixture(tmp_path / "changed", regions)["global_optionsets"]
+            srv.fixture["changed"] = {"new_order": ["new_region"]}
+            assert sync(client, ["new_order"], state, store=store) == {"updated": ["new_order"]}
+
+        synced = _fields()
+        assert synced["new_region"]["globalOptionSet"] == "new_region"
+        assert not synced["new_region"]["optionset"]
+        assert synced["new_priority"] == harvested["new_priority"]
+        with open("fields/global_optionsets.json", "r", encoding="utf-8") as f:
+            labels = [o["label"] for o in json.load(f)["new_region"]]
+        assert labels == ["North", "South", "West"]
+    finally:
+        os.chdir(cwd)
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory(prefix="test_sync_") as workdir:
+        test_sync_keeps_global_choice_refs(pathlib.Path(workdir))
+    print("ok")
@@ -0,0 +1,17 @@
+"""
+token_broker.py
+---------------
+
+Loads the token broker shared by every app in this repository
+(shared/token_broker.py at the repository root), so `from token_broker
+import get_token` keeps working from this folder without a pasted copy.
+"""
+
+import importlib.util, os, sys
+
+_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     "shared", "token_broker.py")
+_spec = importlib.util.spec_from_file_location(__name__, _path)
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module     # importers get the shared module itself
+_spec.loader.exec_module(_module)
@@ -1,22 +1,79 @@
+import glob
 import json
 import os
 import re
+from field_matcher import FieldMap, FieldMatcher, normalize
+from field_normalizer import normalize_fields
+from entity_recognizer import recognizer_for
+from field_ranker import rank_fields, close_candidates, pick_field
+from file_cache import MtimeCache
+from option_index import FieldsDict, OptionIndex
+from metadata_store import get_store, GLOBAL_OPTIONSETS_FILE, STORE_PATH
+from relationship_graph import RelationshipGraph, Hop, format_path
+
+# Placeholder for fields while a table's metadata is fetched in the background
+FETCHING_METADATA = "*fetching metadata*"
+
+TRIGGERS = ("create", "update", "delete", "assign")    # first match wins
+
+# Entity and field maps, reloaded when their source files change
+metadata_cache = MtimeCache(int(os.getenv("METADATA_CACHE_SIZE", "128")))
 
 def load_entity_map(path="entity_map.json"):
-    """Loads entity display/logical name mapping."""
+    """Loads entity display/logical name mapping (cached; do not mutate the result)."""
+    return metadata_cache.get(("entity_map", path), [path], lambda: _read_entity_map(path))
+
+def _read_entity_map(path):
     if not os.path.exists(path):
         return {}
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def load_field_map(entity_logical_name):
-    """Loads fields (display name/logical name) for given entity (dict format)."""
+def load_fields_dict(entity_logical_name):
+    """
+    Full field metadata for an entity: metadata store first, fields/*.json as fallback.
+    Normalized on load (see field_normalizer): files harvested before it ran still hold shadow columns.
+    """
+    store = get_store()
+    if store is not None and store.has_entity(entity_logical_name):
+        return FieldsDict(normalize_fields(store.get_fields(entity_logical_name), _optionset_pool()))
     path = f"fields/{entity_logical_name}_fields.json"
     if not os.path.exists(path):
-        return {}, {}
+        return {}
     with open(path, "r", encoding="utf-8") as f:
         fields_dict = json.load(f)
-    out = {}
+    if any(info.get("globalOptionSet") for info in fields_dict.values()):
+        global_sets = load_global_optionsets()
+        for info in fields_dict.values():
+            if info.get("globalOptionSet"):
+                info["optionset"] = global_sets.get(info["globalOptionSet"], [])
+    return FieldsDict(normalize_fields(fields_dict, _optionset_pool()))
+
+def _optionset_pool():
+    """Option lists shared by the loaded field dicts; a new pool whenever field metadata changes."""
+    sources = sorted(glob.glob("fields/*_fields.json")) + [f"fields/{GLOBAL_OPTIONSETS_FILE}",
+                                                           STORE_PATH, f"{STORE_PATH}-wal"]
+    return metadata_cache.get(("optionset_pool",), sources, dict)
+
+def load_global_optionsets(path=f"fields/{GLOBAL_OPTIONSETS_FILE}"):
+    """Global choices shared by harvested columns: {name: [{value, label}, ...]}."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_field_map(entity_logical_name):
+    """Loads fields (display name/logical name) for given entity (cached; do not mutate the result)."""
+    sources = [f"fields/{entity_logical_name}_fields.json", f"fields/{GLOBAL_OPTIONSETS_FILE}",
+               STORE_PATH, f"{STORE_PATH}-wal"]
+    return metadata_cache.get(("field_map", entity_logical_name), sources,
+                              lambda: _build_field_map(entity_logical_name))
+
+def _build_field_map(entity_logical_name):
+    fields_dict = load_fields_dict(entity_logical_name)
+    if not fields_dict:
+        return FieldMap(), {}
+    out = FieldMap()
     for logical, info in fields_dict.items():
         display = info.get("displayName", "")
         if logical:
@@ -25,41 +82,54 @@ def load_field_map(entity_logical_name):
             out[display.lower()] = logical
     return out, fields_dict  # (field_map, full_fields_dict)
 
-def normalize(text):
-    """Normalize for matching (lowercase, strip, remove non-alphanum)."""
-    return re.sub(r"[^a-z0-9]", "", text.lower())
+def load_relationship_graph():
+    """Lookup graph over every harvested table (cached until the store or a field file changes)."""
+    sources = sorted(glob.glob("fields/*_fields.json")) + [STORE_PATH, f"{STORE_PATH}-wal"]
+    return metadata_cache.get(("relationship_graph",), sources, _build_relationship_graph)
+
+def _build_relationship_graph():
+    store = get_store()
+    entities = set(store.entities()) if store is not None else set()
+    entities.update(os.path.basename(p)[:-len("_fields.json")] for p in glob.glob("fields/*_fields.json"))
+    return RelationshipGraph({e: load_fields_dict(e) for e in entities})
 
 def extract_fields_from_text(field_map, text):
     """
     Broad, inclusive field extractor.
     Returns all logical names whose display or logical name (lowercase) appears as substring in text.
+    A FieldMap reuses its precompiled matcher; a plain dict is compiled per call.
     """
-    norm_text = normalize(text)
-    found = []
-    for display, logical in field_map.items():
-        norm_display = normalize(display)
-        norm_logical = normalize(logical)
-        if norm_display and norm_display in norm_text:
-            found.append(logical)
-        elif norm_logical and norm_logical in norm_text:
-            found.append(logical)
-    # Fallback: substring match in lowercased user text
-    for display, logical in field_map.items():
-        if display in text.lower() or logical in text.lower():
-            if logical not in found:
-                found.append(logical)
-    # Remove duplicates, preserve order
-    return list(dict.fromkeys(found))
+    matcher = field_map.matcher if isinstance(field_map, FieldMap) else FieldMatcher(field_map)
+    return matcher.find(text)
 
-def get_optionset_value(fields_json, field_logical, target_label):
-    """Return the numeric value for an option label, or None."""
+def _option_index(fields_json, field_logical):
+    if isinstance(fields_json, FieldsDict):
+        return fields_json.option_indexes.get(field_logical)
     info = fields_json.get(field_logical)
     if not info or "optionset" not in info:
         return None
-    for opt in info["optionset"]:
-        if opt["label"].lower() == target_label.lower():
-            return opt["value"]
-    return None
+    return OptionIndex(info["optionset"])
+
+def get_optionset_value(fields_json, field_logical, target_label):
+    """Return the numeric value for an option label (case/whitespace-insensitive, any language), or None."""
+    index = _option_index(fields_json, field_logical)
+    return index.value(target_label) if index else None
+
+def get_optionset_label(fields_json, field_logical, value, lcid=None):
+    """Return the label for an option value (in language `lcid` when harvested), or None."""
+    index = _option_index(fields_json, field_logical)
+    return index.label(value, lcid) if index else None
+
+def resolve_optionset_values(fields_json, pairs):
+    """Bulk get_optionset_value: {(field_logical, label): value or None} for prompt/code building."""
+    indexes = {}
+    out = {}
+    for field_logical, label in pairs:
+        if field_logical not in indexes:
+            indexes[field_logical] = _option_index(fields_json, field_logical)
+        index = indexes[field_logical]
+        out[(field_logical, label)] = index.value(label) if index else None
+    return out
 
 def get_lookup_targets(fields_json, field_logical):
     """Return a list of lookup target logical names, or [] if not a lookup."""
@@ -68,47 +138,50 @@ def get_lookup_targets(fields_json, field_logical):
         return []
     return info["targets"]
 
-def extract_requirements(conversation, requirements_agent=None):
+def extract_requirements(conversation, requirements_agent=None, catalog=None):
     """
     Extracts entity, trigger, fields, and logic from conversation.
     Uses entity_map.json and fields/{entity}_fields.json for mapping and validation.
     If multiple fields are found, and requirements_agent is provided, uses the LLM agent to refine.
+    With a MetadataCatalog, metadata comes from memory; a table whose fields are
+    still being fetched yields fields = FETCHING_METADATA instead of blocking.
     """
     requirements = ["entity", "trigger", "fields", "logic"]
     reqs = {r: "" for r in requirements}
     text = " ".join(m["content"] for m in conversation if m["role"] == "user")
 
-    # --- Entity extraction (map display name or logical name) ---
-    entity_map = load_entity_map()
-    found_entity = ""
-    for display, logical in entity_map.items():
-        if display.lower() in text.lower() or logical.lower() in text.lower():
-            found_entity = logical
-            break
-    if found_entity:
-        reqs["entity"] = found_entity
+    # --- Entity extraction (whole-word, longest display or logical name; earliest map entry wins) ---
+    entity_map = catalog.entity_map if catalog is not None else load_entity_map()
+    recognizer = catalog.entity_recognizer if catalog is not None else recognizer_for(entity_map)
+    mention = recognizer.best(text)
+    if mention:
+        reqs["entity"] = mention.logical
 
     # --- Trigger extraction ---
-    for trig in ("create", "update", "delete", "assign"):
+    for trig in TRIGGERS:
         if trig in text.lower():
             reqs["trigger"] = trig
             break
 
     # --- Field extraction ---
     found_fields = []
+    loaded = None
     if reqs["entity"]:
-        field_map, _ = load_field_map(reqs["entity"])
+        if catalog is not None:
+            loaded = catalog.field_map(reqs["entity"])
+        else:
+            loaded = load_field_map(reqs["entity"])
+    if reqs["entity"] and loaded is None:
+        # table metadata is being fetched in the background
+        reqs["fields"] = FETCHING_METADATA
+    elif reqs["entity"]:
+        field_map, _ = loaded
         found_fields = extract_fields_from_text(field_map, text)
-        # If multiple fields found and an agent is provided, refine with LLM
+        reqs["related"] = extract_related(reqs["entity"], text, found_fields, catalog)
+        # If multiple fields found and an agent is provided, rank them; the LLM only breaks close calls
         if len(found_fields) > 1 and requirements_agent is not None:
-            clarify_prompt = (
-                f"The user provided this requirement:\n"
-                f"\"{text.strip()}\"\n\n"
-                f"The possible field matches (by logical name) are: {', '.join(found_fields)}.\n\n"
-                "Given the above, which one is most likely correct? Reply with only the best logical name."
-            )
-            agent_reply = requirements_agent.generate_reply([{"content": clarify_prompt, "role": "user"}])
-            found_fields = [agent_reply.strip()]
+            found_fields = _resolve_fields(requirements_agent, field_map, text, found_fields,
+                                           _table_names(entity_map, reqs["entity"]))
         reqs["fields"] = ", ".join(sorted(set(found_fields))) if found_fields else "*pending*"
     else:
         reqs["fields"] = "*pending*"
@@ -120,3 +193,152 @@ def extract_requirements(conversation, requirements_agent=None):
             break
 
     return reqs
+
+def extract_related(entity, text, candidates, catalog=None):
+    """
+    Fields of other tables reached through lookups, e.g. "account.primarycontactid → contact.emailaddress1".
+    Paths start at the lookup columns among `candidates` and at other tables mentioned in the text;
+    the field on the last table is the best-ranked one, if any is a clear winner.
+    """
+    if catalog is not None:
+        graph, entity_map, recognizer = catalog.relationship_graph(), catalog.entity_map, catalog.entity_recognizer
+    else:
+        graph, entity_map = load_relationship_graph(), load_entity_map()
+        recognizer = recognizer_for(entity_map)
+    loaded = catalog.field_map(entity) if catalog is not None else load_field_map(entity)
+    field_map = loaded[0] if loaded else {}
+    paths = []
+    for column in candidates:
+        for target in graph.targets(entity, column):
+            # a lookup column hit only through the target's table name ("Event" → event) names the table
+            names = _table_names(entity_map, entity) + _table_names(entity_map, target)
+            ranked = rank_fields(field_map, text, [column], names)
+            if ranked and ranked[0].tier != "table_name":
+                paths.append([Hop(entity, column, target)])
+    for mention in recognizer.find_all(text):
+        if mention.logical == entity or any(p[-1].target == mention.logical for p in paths):
+            continue
+        # "on event update": the table the trigger fires on, not one reached from `entity`
+        if _is_trigger_subject(text, mention):
+            continue
+        path = graph.path(entity, mention.logical)
+        if path:
+            paths.append(path)
+
+    related = []
+    for path in paths:
+        target = path[-1].target
+        loaded = catalog.field_map(target) if catalog is not None else load_field_map(target)
+        if not loaded or not loaded[0]:
+            continue
+        target_fields = extract_fields_from_text(loaded[0], text)
+        # the tables' own names and the lookup column name the path, not a field on it,
+        # so a field hit only through one of them is no related field
+        ignore = _table_names(entity_map, entity) + _table_names(entity_map, target) + [path[-1].column]
+        ranked = [r for r in rank_fields(loaded[0], text, target_fields, ignore) if r.tier != "table_name"]
+        best = pick_field(ranked)
+        if best:
+            related.append(format_path(path, best))
+    return list(dict.fromkeys(related))
+
+def _is_trigger_subject(text, mention):
+    """Whether a trigger verb follows the table mention within two words ("event is updated")."""
+    following = re.findall(r"[a-z]+", text[mention.end:].lower())[:2]
+    return any(word.startswith(trig) for word in following for trig in TRIGGERS)
+
+def _clarify_fields(requirements_agent, text, candidates):
+    """Ask the LLM which of several candidate fields the user means."""
+    clarify_prompt = (
+        f"The user provided this requirement:\n"
+        f"\"{text.strip()}\"\n\n"
+        f"The possible field matches (by logical name) are: {', '.join(candidates)}.\n\n"
+        "Given the above, which one is most likely correct? Reply with only the best logical name."
+    )
+    agent_reply = requirements_agent.generate_reply([{"content": clarify_prompt, "role": "user"}])
+    return [agent_reply.strip()]
+
+def _table_names(entity_map, entity):
+    return [display for display, logical in entity_map.items() if logical == entity] + [entity]
+
+def _resolve_fields(requirements_agent, field_map, text, candidates, table_names=()):
+    """Best candidate by score; asks the LLM only when the top scores are within the margin."""
+    close = close_candidates(rank_fields(field_map, text, candidates, table_names)) or candidates
+    if len(close) == 1:
+        return close
+    return _clarify_fields(requirements_agent, text, close)
+
+def update_requirements(conversation, state, requirements_agent=None, catalog=None):
+    """
+    Incremental extract_requirements for a chat session.
+    `state` is a JSON-serializable dict kept per session (start with {}); only the
+    user messages appended since the last call are scanned. The LLM is asked to
+    disambiguate only when new candidate fields appear, and the conversation is
+    rescanned for fields only when the resolved entity changes.
+    Matching is per message, so a name split across two messages is not found.
+    """
+    if not state or state["seen"] > len(conversation):
+        state.clear()
+        state.update(seen=0, entity="", entity_name="", trigger="", logic="",
+                     fields_seen=0, candidates=[], picked=[], related=[])
+    entity_map = catalog.entity_map if catalog is not None else load_entity_map()
+    recognizer = catalog.entity_recognizer if catalog is not None else recognizer_for(entity_map)
+    entity_before = state["entity"]
+    entity_rank = recognizer.rank(state["entity_name"]) if state["entity"] else None
+
+    for m in conversation[state["seen"]:]:
+        if m["role"] != "user":
+            continue
+        lower = m["content"].lower()
+        # earliest entity_map entry wins, as in a full scan
+        mention = recognizer.best(m["content"])
+        if mention and (entity_rank is None or mention.rank < entity_rank):
+            state["entity"], state["entity_name"] = mention.logical, mention.name
+            entity_rank = mention.rank
+        for trig in TRIGGERS:
+            if trig == state["trigger"]:
+                break
+            if trig in lower:
+                state["trigger"] = trig
+                break
+        if len(m["content"].split()) > 4:
+            state["logic"] = m["content"]
+    state["seen"] = len(conversation)
+
+    if state["entity"] != entity_before:
+        # different table, different columns: rescan every user message
+        state.update(fields_seen=0, candidates=[], picked=[], related=[])
+
+    reqs = {"entity": state["entity"], "trigger": state["trigger"], "fields": "*pending*",
+            "logic": state["logic"]}
+    if not state["entity"]:
+        return reqs
+    loaded = catalog.field_map(state["entity"]) if catalog is not None else load_field_map(state["entity"])
+    if loaded is None:
+        # table metadata is being fetched in the background; scan once it is loaded
+        reqs["fields"] = FETCHING_METADATA
+        return reqs
+
+    field_map, _ = loaded
+    user_messages = [m["content"] for m in conversation if m["role"] == "user"]
+    added = False
+    for content in user_messages[state["fields_seen"]:]:
+        found = extract_fields_from_text(field_map, content)
+        for logical in found:
+            if logical not in state["candidates"]:
+                state["candidates"].append(logical)
+                added = True
+        for path in extract_related(state["entity"], content, found, catalog):
+            if path not in state.setdefault("related", []):
+                state["related"].append(path)
+    state["fields_seen"] = len(user_messages)
+    reqs["related"] = list(state.get("related", []))
+
+    found_fields = state["candidates"]
+    if len(found_fields) > 1 and requirements_agent is not None:
+        if added or not state["picked"]:
+            state["picked"] = _resolve_fields(requirements_agent, field_map, " ".join(user_messages),
+                                              found_fields, _table_names(entity_map, state["entity"]))
+        found_fields = state["picked"]
+    if found_fields:
+        reqs["fields"] = ", ".join(sorted(set(found_fields)))
+    return reqs
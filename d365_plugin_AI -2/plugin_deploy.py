@@ -2,7 +2,7 @@ import os
 import json
 import base64
 import requests
-import msal
+from token_broker import get_token, TokenError
 import shutil
 import subprocess
 
@@ -36,18 +36,10 @@ def deploy_with_webapi_profile(
     tenant_id = prof["tenant_id"]
     client_secret = prof["client_secret"]
 
-    scope = [f"{env_url}/.default"]
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-
-    app = msal.ConfidentialClientApplication(
-        client_id=client_id,
-        client_credential=client_secret,
-        authority=authority
-    )
-    token_result = app.acquire_token_for_client(scopes=scope)
-    if "access_token" not in token_result:
-        raise WebApiError(token_result.get("error_description") or str(token_result))
-    token = token_result["access_token"]
+    try:
+        token = get_token(tenant_id, client_id, client_secret, env_url)
+    except TokenError as exc:
+        raise WebApiError(str(exc))
 
     if not assembly_name:
         assembly_name = os.path.splitext(os.path.basename(dll_path))[0]
@@ -1,14 +1,8 @@
 import requests
-from msal import ConfidentialClientApplication
+from token_broker import get_token
 
 def get_access_token(tenant_id, client_id, client_secret, resource):
-    app = ConfidentialClientApplication(
-        client_id=client_id,
-        authority=f"https://login.microsoftonline.com/{tenant_id}",
-        client_credential=client_secret,
-    )
-    token = app.acquire_token_for_client(scopes=[f"{resource}/.default"])
-    return token["access_token"]
+    return get_token(tenant_id, client_id, client_secret, resource)
 
 def list_plugin_assemblies(env_url, client_id, tenant_id, client_secret):
     resource = env_url.rstrip("/")
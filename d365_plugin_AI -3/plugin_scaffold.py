@@ -1,7 +1,7 @@
 import os
 import subprocess
 import requests
-from msal import ConfidentialClientApplication
+from token_broker import get_token
 import json
 import re
 import glob
@@ -107,16 +107,7 @@ def deploy_plugin_pacprofile(project_dir, pac_profile_name, plugin_assembly_id,
     return result.stdout, result.stderr, result.returncode
 
 def get_access_token(tenant_id, client_id, client_secret, resource):
-    app = ConfidentialClientApplication(
-        client_id=client_id,
-        authority=f"https://login.microsoftonline.com/{tenant_id}",
-        client_credential=client_secret,
-    )
-    result = app.acquire_token_for_client(scopes=[f"{resource}/.default"])
-    if "access_token" in result:
-        return result["access_token"]
-    else:
-        raise Exception(f"Token error: {result.get('error_description', str(result))}")
+    return get_token(tenant_id, client_id, client_secret, resource)
 
 def list_solutions_webapi(env_url, client_id, tenant_id, client_secret):
     resource = env_url.rstrip("/")
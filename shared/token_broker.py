@@ -0,0 +1,191 @@
+"""
+token_broker.py
+---------------
+
+One place to get client-credentials tokens for Dataverse.
+
+Every caller used to build its own ConfidentialClientApplication and ask
+Azure AD for a fresh token.  The broker keeps one MSAL app per
+(tenant, client_id) and one token per (tenant, client_id, resource):
+
+- tokens are served from memory until REFRESH_MARGIN seconds before expiry
+- a daemon thread renews tokens before they expire, so callers normally
+  never wait on the token endpoint; a key not requested for IDLE_SECONDS
+  is dropped instead of renewed
+- MSAL's token cache can be persisted to disk (TOKEN_CACHE_PATH env var),
+  readable by the owner only (0600) since it holds bearer tokens
+- safe to call from several threads at once
+
+This is the one copy shared by the apps in this repository; the
+token_broker.py in each app folder only loads it.
+
+Usage:
+    from token_broker import get_token
+    token = get_token(tenant_id, client_id, client_secret, resource)
+"""
+
+import os, threading, time
+from typing import Dict, Tuple
+import msal
+
+REFRESH_MARGIN = 300        # seconds before expiry a token is renewed
+REFRESH_INTERVAL = 60       # how often the background refresher wakes up
+IDLE_SECONDS = int(os.getenv("TOKEN_IDLE_SECONDS", "3600"))   # stop renewing unused keys after this
+AUTHORITY_HOST = os.getenv("AAD_AUTHORITY_HOST", "https://login.microsoftonline.com")
+
+
+class TokenError(RuntimeError):
+    pass
+
+
+class TokenBroker:
+    def __init__(self, cache_path: str | None = None, background_refresh: bool = True,
+                 authority_host: str = AUTHORITY_HOST,
+                 app_factory=msal.ConfidentialClientApplication) -> None:
+        self.cache_path = cache_path
+        self.authority_host = authority_host.rstrip("/")
+        self.app_factory = app_factory       # swapped for a stand-in by bench_metadata.py
+        self.cache = msal.SerializableTokenCache()
+        if cache_path and os.path.isfile(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                self.cache.deserialize(f.read())
+
+        self._apps: Dict[Tuple[str, str], Tuple[str, msal.ConfidentialClientApplication]] = {}
+        self._tokens: Dict[Tuple[str, str, str], Tuple[str, float]] = {}
+        self._last_used: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._background_refresh = background_refresh
+        self._refresher: threading.Thread | None = None
+
+    def get_token(self, tenant_id: str, client_id: str, client_secret: str, resource: str) -> str:
+        key = (tenant_id, client_id, resource.rstrip("/"))
+        with self._lock:
+            self._last_used[key] = time.time()
+        cached = self._tokens.get(key)
+        if cached and time.time() < cached[1] - REFRESH_MARGIN:
+            return cached[0]
+
+        with self._key_lock(key):
+            # another thread may have refreshed while we waited
+            cached = self._tokens.get(key)
+            if cached and time.time() < cached[1] - REFRESH_MARGIN:
+                return cached[0]
+            token = self._acquire(key, client_secret)
+
+        self._start_refresher()
+        return token
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._last_used.clear()
+
+    # ----- Private helper methods -----
+    def _key_lock(self, key: Tuple[str, str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _app(self, tenant_id: str, client_id: str, client_secret: str) -> msal.ConfidentialClientApplication:
+        with self._lock:
+            secret, app = self._apps.get((tenant_id, client_id), (None, None))
+            if app is None or secret != client_secret:
+                app = self.app_factory(
+                    client_id=client_id,
+                    authority=f"{self.authority_host}/{tenant_id}",
+                    client_credential=client_secret,
+                    token_cache=self.cache,
+                )
+                self._apps[(tenant_id, client_id)] = (client_secret, app)
+            return app
+
+    def _acquire(self, key: Tuple[str, str, str], client_secret: str, force: bool = False) -> str:
+        tenant_id, client_id, resource = key
+        app = self._app(tenant_id, client_id, client_secret)
+        if force:
+            # MSAL would otherwise hand back the cached token until ~5 min before expiry
+            for at in self.cache.find(msal.TokenCache.CredentialType.ACCESS_TOKEN,
+                                      target=[f"{resource}/.default"],
+                                      query={"client_id": client_id}):
+                self.cache.remove_at(at)
+        result = app.acquire_token_for_client(scopes=[f"{resource}/.default"])
+        if "access_token" not in result:
+            raise TokenError(f"Token error: {result.get('error_description') or result}")
+        expires_at = time.time() + int(result.get("expires_in", 3599))
+        with self._lock:
+            self._tokens[key] = (result["access_token"], expires_at)
+        self._persist()
+        return result["access_token"]
+
+    def _persist(self) -> None:
+        if not self.cache_path or not self.cache.has_state_changed:
+            return
+        with self._lock:
+            # bearer tokens: owner-only, also when the file already existed with wider rights
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            if hasattr(os, "fchmod"):
+                os.fchmod(fd, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.cache.serialize())
+            self.cache.has_state_changed = False
+
+    def _start_refresher(self) -> None:
+        if not self._background_refresh or self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(
+                    target=self._refresh_loop, name="token-broker-refresh", daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            # nothing may end this thread: it is started only once
+            try:
+                self._drop_idle()
+                with self._lock:
+                    tokens = list(self._tokens.items())
+            except Exception as exc:
+                print(f"Token refresh failed: {exc}")
+                continue
+            # renew anything that would expire before the next wake-up
+            horizon = time.time() + REFRESH_MARGIN + REFRESH_INTERVAL
+            for key, (_, expires_at) in tokens:
+                if expires_at > horizon:
+                    continue
+                secret, _ = self._apps.get(key[:2], (None, None))
+                if secret is None:
+                    continue
+                try:
+                    with self._key_lock(key):
+                        self._acquire(key, secret, force=True)
+                except Exception as exc:
+                    print(f"Token refresh failed for {key[2]}: {exc}")
+
+    def _drop_idle(self) -> None:
+        """Forget tokens nobody requested for IDLE_SECONDS; a later request acquires afresh."""
+        cutoff = time.time() - IDLE_SECONDS
+        with self._lock:
+            for key in [k for k in self._tokens if self._last_used.get(k, 0) < cutoff]:
+                self._tokens.pop(key, None)
+                self._last_used.pop(key, None)
+                # the key's lock stays: a caller may hold or be about to take it
+
+
+_broker: TokenBroker | None = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> TokenBroker:
+    """Process-wide broker; disk cache enabled when TOKEN_CACHE_PATH is set."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = TokenBroker(cache_path=os.getenv("TOKEN_CACHE_PATH"))
+    return _broker
+
+
+def get_token(tenant_id: str, client_id: str, client_secret: str, resource: str) -> str:
+    return get_broker().get_token(tenant_id, client_id, client_secret, resource)